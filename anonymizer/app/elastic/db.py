@@ -1,9 +1,12 @@
-from hashlib import sha512
+import asyncio
 import os
 from time import time
-from typing import Any, Mapping, Optional
-from elasticsearch import Elasticsearch, ConflictError, NotFoundError
+from typing import Any, List, Mapping, Optional, Tuple
+import orjson
+from elasticsearch import Elasticsearch, NotFoundError, TransportError
+from elasticsearch.helpers import streaming_bulk
 
+from app.hashing import content_hash
 from app.schema import AnnotatedDocument
 
 ES_HOST = os.getenv("ANONYMIZER_ES_HOST")
@@ -31,12 +34,16 @@ ES_MAPPING = {
     }
 }
 
+# Documents are inserted in bulk, so there is no need for frequent refreshes
+ES_SETTINGS = {"index": {"refresh_interval": "30s"}}
+
 
 def connect_elasticsearch(
     host: str = ES_HOST,
     port: int = ES_PORT,
     index: str = ES_INDEX,
     mapping: Mapping[str, Any] = ES_MAPPING,
+    settings: Mapping[str, Any] = ES_SETTINGS,
 ) -> Elasticsearch:
     """Connects to an Elasticsearch server.
 
@@ -45,46 +52,181 @@ def connect_elasticsearch(
         port (int, optional): Port on the host. Defaults to ES_PORT.
         index (str, optional): Index name to create if it does not exist. Defaults to ES_INDEX.
         mapping (Mapping[str, Any], optional): Mapping of the index. Defaults to ES_MAPPING.
+        settings (Mapping[str, Any], optional): Settings of the index. Defaults to ES_SETTINGS.
 
     Returns:
         Elasticsearch: Connection to Elasticsearch
     """
     # Connects to the ES server
-    client = Elasticsearch(f"http://{host}:{port}", sniff_on_start=True)
+    client = Elasticsearch(
+        f"http://{host}:{port}", sniff_on_start=True, http_compress=True
+    )
     # If the index does not exist, creates it
     if not client.indices.exists(index=index):
-        client.indices.create(index=index, body={"mappings": mapping})
+        client.indices.create(
+            index=index, body={"settings": settings, "mappings": mapping}
+        )
     return client
 
 
+class BulkIndexer:
+    """Buffers document insertions and sends them to Elasticsearch in bulk."""
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index: str = ES_INDEX,
+        max_actions: int = 500,
+        flush_interval: float = 1.0,
+        max_wait: float = 0.005,
+    ) -> None:
+        """Creates the indexer. A bulk request is sent as soon as no document arrives
+        for `max_wait` seconds, or when it reaches one of the two upper limits.
+
+        Args:
+            client (Elasticsearch): Connection to Elasticsearch.
+            index (str, optional): Index where to add the documents. Defaults to ES_INDEX.
+            max_actions (int, optional): Maximum number of documents in a bulk request. Defaults to 500.
+            flush_interval (float, optional): Maximum seconds to gather documents after the first one. Defaults to 1.0.
+            max_wait (float, optional): Seconds to wait for the next document before sending. Defaults to 0.005.
+        """
+        self.client = client
+        self.index = index
+        self.max_actions = max_actions
+        self.flush_interval = flush_interval
+        self.max_wait = max_wait
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the background coroutine that flushes the pending documents."""
+        self.__queue = asyncio.Queue()
+        self.__worker = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        """Flushes the pending documents and stops the background coroutine."""
+        await self.__queue.join()
+        self.__worker.cancel()
+        try:
+            await self.__worker
+        except asyncio.CancelledError:
+            pass
+
+    def submit(self, doc_id: str, body: Mapping[str, Any] | str) -> asyncio.Future:
+        """Enqueues the creation of a document.
+
+        Args:
+            doc_id (str): Document ID.
+            body (Mapping[str, Any] | str): Document source, possibly already serialized to JSON.
+
+        Returns:
+            asyncio.Future: Resolved with the document ID, or None if it already exists.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.__queue.put_nowait((doc_id, body, future))
+        return future
+
+    async def __collect(
+        self,
+    ) -> List[Tuple[str, Mapping[str, Any] | str, asyncio.Future]]:
+        # Waits for the first document, then gathers the others while they keep
+        # arriving, until the deadline
+        batch = [await self.__queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.max_actions:
+            # Takes the documents already queued without waiting
+            try:
+                batch.append(self.__queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = min(self.max_wait, deadline - loop.time())
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def __flush(
+        self, batch: List[Tuple[str, Mapping[str, Any] | str, asyncio.Future]]
+    ) -> List[Tuple[bool, Mapping[str, Any]]]:
+        actions = (
+            {"_op_type": "create", "_index": self.index, "_id": doc_id, "_source": body}
+            for doc_id, body, _ in batch
+        )
+        # Results are yielded in the same order of the actions
+        return list(
+            streaming_bulk(
+                self.client,
+                actions,
+                chunk_size=self.max_actions,
+                raise_on_error=False,
+                raise_on_exception=False,
+            )
+        )
+
+    def __resolve(
+        self,
+        batch: List[Tuple[str, Mapping[str, Any] | str, asyncio.Future]],
+        results: List[Tuple[bool, Mapping[str, Any]]],
+    ) -> None:
+        for (_, _, future), (ok, item) in zip(batch, results):
+            # The caller may have been cancelled in the meantime
+            if future.done():
+                continue
+            info = item["create"]
+            if ok:
+                future.set_result(info["_id"])
+            # The document already exists
+            elif info.get("status") == 409:
+                future.set_result(None)
+            else:
+                future.set_exception(
+                    TransportError(info.get("status", "N/A"), info.get("error"))
+                )
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.__collect()
+            # A failed batch is given back to its callers, without stopping the worker
+            try:
+                results = await loop.run_in_executor(None, self.__flush, batch)
+                self.__resolve(batch, results)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+
 def insert_document(
-    client: Elasticsearch,
+    indexer: BulkIndexer,
     document: AnnotatedDocument,
-    index: str = ES_INDEX,
     encoding: str = "utf-8",
-) -> Optional[str]:
+) -> asyncio.Future:
     """Adds a document to the Elasticsearch index, only if it does not exist.
     Args:
-        client (Elasticsearch): Connection to Elasticsearch.
+        indexer (BulkIndexer): Bulk indexer connected to Elasticsearch.
         document (AnnotatedDocument): Annotated document.
-        index (str, optional): Index where to add `document`. Defaults to ES_INDEX.
         encoding (str, optional): Encoding to use when computing the hash. Defaults to "utf-8".
     Returns:
-        Optional[str]: Document ID, or None if the insertion went bad.
+        asyncio.Future: Resolved with the document ID, or None if the insertion went bad.
     """
     # Computes the hash of the text content
-    hash_value: str = sha512(document.content.encode(encoding)).hexdigest()
+    hash_value: str = content_hash(document.content, encoding)
     # If needed, computes the timestamp
     if document.timestamp is None:
         document.timestamp = int(time())
-    # Inserts the element in the index
-    try:
-        response = client.create(
-            index=index, id=hash_value, body=document.dict(), refresh=True
-        )
-        return response["_id"]
-    except ConflictError:
-        return None
+    # Serializes the document once, the client sends strings as they are
+    body: str = orjson.dumps(document.dict()).decode()
+    # Enqueues the element for the next bulk insertion
+    return indexer.submit(hash_value, body)
 
 
 def retrieve_document(
@@ -115,7 +257,7 @@ def remove_document(client: Elasticsearch, doc_id: str, index: str = ES_INDEX) -
         bool: If the deletion actually deleted the document.
     """
     try:
-        client.delete(index=index, id=doc_id, refresh=True)
+        client.delete(index=index, id=doc_id)
         return True
     except NotFoundError:
         return False
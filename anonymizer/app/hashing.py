@@ -0,0 +1,21 @@
+from hashlib import sha512
+
+
+def content_hash(
+    content: str, encoding: str = "utf-8", chunk_size: int = 1 << 20
+) -> str:
+    """Computes the SHA-512 digest of a text, encoding it one chunk at a time.
+    The digest is the ID of the stored documents, so the algorithm must never change.
+
+    Args:
+        content (str): Text to hash.
+        encoding (str, optional): Encoding of the text. Defaults to "utf-8".
+        chunk_size (int, optional): Number of characters encoded at once. Defaults to 1 << 20.
+
+    Returns:
+        str: Hexadecimal digest of the text.
+    """
+    digest = sha512()
+    for i in range(0, len(content), chunk_size):
+        digest.update(content[i : i + chunk_size].encode(encoding))
+    return digest.hexdigest()
@@ -2,28 +2,86 @@ import os
 from pathlib import Path
 from typing import List
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from app.elastic.db import (
+    BulkIndexer,
     connect_elasticsearch,
     insert_document,
     retrieve_document,
     remove_document,
 )
+from app.hashing import content_hash
 from app.model.architecture import NERAnnotator
+from app.model.batching import PredictionBatcher
+from app.model.cache import PredictionCache
 
 from app.schema import AnnotatedDocument, Span, Text
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Path of the annotation model checkpoint on disk
 MODEL_PATH = Path(os.getenv("ANONYMIZER_MODEL_DIR"))
 
+# Whether to quantize the model to int8 at startup
+QUANTIZE_MODEL = os.getenv("ANONYMIZER_QUANTIZE_MODEL", "false").lower() == "true"
+
+# Whether to predict in bfloat16 (faster only on hardware supporting it natively)
+AUTOCAST_MODEL = os.getenv("ANONYMIZER_AUTOCAST", "false").lower() == "true"
+
+# Whether to compile the model with TorchInductor at startup
+COMPILE_MODEL = os.getenv("ANONYMIZER_COMPILE_MODEL", "false").lower() == "true"
+
+# Maximum number of texts predicted together and seconds to wait to fill a batch
+MAX_BATCH_SIZE = 16
+MAX_BATCH_WAIT = 0.005
+# Maximum number of 512-token rows in a forward pass, as long texts overflow into many
+MAX_BATCH_ROWS = 16
+
+# Maximum number of predictions kept in memory
+CACHE_SIZE = 1024
+
 # Annotation model
 model = NERAnnotator.from_directory(MODEL_PATH)
+if QUANTIZE_MODEL:
+    model.quantize_for_inference()
+if AUTOCAST_MODEL:
+    model.autocast_for_inference()
+# Compiles last, so that the warm-up uses the final inference settings
+if COMPILE_MODEL:
+    model.compile_for_inference()
+
+# Coalesces concurrent predictions into batches
+batcher = PredictionBatcher(
+    model,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait=MAX_BATCH_WAIT,
+    max_rows=MAX_BATCH_ROWS,
+)
+
+# Predictions of recently seen texts (the model is frozen, so they never go stale)
+cache = PredictionCache(maxsize=CACHE_SIZE)
 
 # Connection to Elasticsearch
 client = connect_elasticsearch()
 
+# Buffers the insertions of new documents
+indexer = BulkIndexer(client)
+
+
+@app.on_event("startup")
+async def start_workers() -> None:
+    """Starts the prediction batcher and the bulk indexer within the event loop."""
+    batcher.start()
+    indexer.start()
+
+
+@app.on_event("shutdown")
+async def stop_workers() -> None:
+    """Stops the prediction batcher and flushes the bulk indexer."""
+    await batcher.stop()
+    await indexer.stop()
+
 
 @app.get("/hello")
 def hello() -> str:
@@ -45,26 +103,40 @@ async def predict_annotations(text: Text) -> List[Span]:
     Returns:
         List[Span]: List of possible "Prodigy-style", char-encoded spans.
     """
-    # Predicts the annotations with the machine learning model
-    spans = model.predict(text.content)
+    # An empty text has no annotations
+    if not text.content or text.content.isspace():
+        return []
+    # Looks for the same text in the cache
+    key = content_hash(text.content)
+    spans = cache.get(key)
+    if spans is None:
+        # Predicts the annotations with the machine learning model, batched with other requests
+        spans = await batcher.predict(text.content)
+        cache.put(key, spans)
     return spans
 
 
 @app.post("/documents", status_code=status.HTTP_201_CREATED)
-def post_document(document: AnnotatedDocument) -> str:
+async def post_document(document: AnnotatedDocument) -> str:
     """Stores a new annotated document.
 
     Args:
         document (AnnotatedDocument): Document to Store.
 
     Raises:
-        HTTPException: If the document already exists.
+        HTTPException: If the document is empty or already exists.
 
     Returns:
         str: Document ID.
     """
-    # Tries to insert the document
-    doc_id = insert_document(client, document)
+    # Rejects empty documents before hashing them
+    if not document.content or document.content.isspace():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document content is empty.",
+        )
+    # Tries to insert the document, waiting for its bulk request
+    doc_id = await insert_document(indexer, document)
     if doc_id is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -1,8 +1,6 @@
-import os
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 from torch import nn
-from torch.nn.utils.rnn import pad_sequence
 from lightning.pytorch import LightningModule
 import torch
 import torch.nn.functional as F
@@ -11,11 +9,17 @@ from allennlp_light import ConditionalRandomField
 from allennlp_light.modules.conditional_random_field.conditional_random_field import (
     allowed_transitions,
 )
-from app.model.encoding import ID2LABEL, LABEL2ID, encode_text, labels_to_spans
+from app.model.encoding import ID2LABEL, LABEL2ID, encode_texts, labels_to_spans
 
 from app.schema import Span
 
 
+# Transitions allowed by the BIO scheme, computed once for every model instance
+_BIO_CONSTRAINTS: List[Tuple[int, int]] = allowed_transitions(
+    constraint_type="BIO", labels=ID2LABEL
+)
+
+
 class NERAnnotator(LightningModule):
     def __init__(
         self,
@@ -37,11 +41,16 @@ class NERAnnotator(LightningModule):
 
         self.crf_layer = ConditionalRandomField(
             num_tags=target_size,
-            constraints=allowed_transitions(constraint_type="BIO", labels=ID2LABEL),
+            constraints=_BIO_CONSTRAINTS,
         )
 
         self.dropout = nn.Dropout(dropout_rate)
 
+        # Quantized layers only accept full precision inputs
+        self.__quantized = False
+        # Whether to predict in bfloat16 (see `autocast_for_inference`)
+        self.__autocast = False
+
         self.save_hyperparameters()
 
     def forward(
@@ -69,21 +78,24 @@ class NERAnnotator(LightningModule):
 
         # project the token representation for classification
         token_scores = self.feedforward(embedded_text_input)
-        token_scores = F.log_softmax(token_scores, dim=-1)
+        # The CRF always works in full precision, even under autocast
+        token_scores = token_scores.float()
 
-        # Computes the list of predicted labels
+        # Computes the list of predicted labels (the normalization does not change the path)
         best_path = self.crf_layer.viterbi_tags(token_scores, attention_mask)
-        # Produces the tensor of predicted labels
-        pred_results = [
-            torch.tensor(label_seq, dtype=torch.int) for label_seq, _ in best_path
-        ]
-        pred_labels = pad_sequence(
-            pred_results, batch_first=True, padding_value=LABEL2ID["O"]
+        # Produces the tensor of predicted labels, padded with "O" up to the input length
+        pred_labels = torch.full(
+            (batch_size, token_scores.size(1)), LABEL2ID["O"], dtype=torch.int
         )
+        for i, (label_seq, _) in enumerate(best_path):
+            pred_labels[i, : len(label_seq)] = torch.as_tensor(
+                label_seq, dtype=torch.int
+            )
 
         # If the labels are specified, computes the loss
         loss = None
         if labels is not None:
+            token_scores = F.log_softmax(token_scores, dim=-1)
             loss = -self.crf_layer(token_scores, labels, attention_mask) / float(
                 batch_size
             )
@@ -98,18 +110,84 @@ class NERAnnotator(LightningModule):
         Returns:
             List[Span]: List of spans.
         """
-        # Encodes the text
-        input_ids, attention_mask, offset_mapping = encode_text(text, self.__tokenizer)
-        # Computes the labels and discards the None loss
-        with torch.no_grad():
-            label_ids, _ = self(input_ids, attention_mask)
-        # Converts the labels to spans
-        spans = []
-        for labels, offsets in zip(label_ids, offset_mapping):
-            span = labels_to_spans(labels, offsets)
-            spans.extend(span)
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts: List[str], max_rows: int = 16) -> List[List[Span]]:
+        """Predicts the spans for a batch of texts, with as few forward passes as possible.
+
+        Args:
+            texts (List[str]): Texts to predict.
+            max_rows (int, optional): Maximum number of rows of 512 tokens in a forward pass,
+            as long texts overflow into many rows. Defaults to 16.
+
+        Returns:
+            List[List[Span]]: List of spans for each text, in the same order of `texts`.
+        """
+        # Encodes all the texts together, padding them to the same length
+        input_ids, attention_mask, offset_mapping, sample_mapping = encode_texts(
+            texts, self.__tokenizer
+        )
+        # Computes the labels, in half precision if enabled, and discards the None loss.
+        # The rows are split in chunks, bounding the memory of a forward pass
+        with torch.no_grad(), torch.autocast(
+            device_type=self.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.__autocast and not self.__quantized,
+        ):
+            chunks = []
+            for start in range(0, input_ids.size(0), max_rows):
+                rows = slice(start, start + max_rows)
+                chunk_labels, _ = self(input_ids[rows], attention_mask[rows])
+                chunks.append(chunk_labels)
+        label_ids = torch.cat(chunks)
+        # Converts the labels to spans, giving back each row to its own text
+        label_ids = label_ids.cpu().numpy()
+        offset_mapping = offset_mapping.numpy()
+        spans: List[List[Span]] = [[] for _ in texts]
+        for labels, offsets, sample in zip(label_ids, offset_mapping, sample_mapping):
+            spans[int(sample)].extend(labels_to_spans(labels, offsets))
         return spans
 
+    def quantize_for_inference(self) -> None:
+        """Quantizes the linear layers of the encoder and of the feed-forward layer to int8.
+        The CRF layer is left in full precision. Only meant for CPU inference.
+        """
+        self.encoder = torch.ao.quantization.quantize_dynamic(
+            self.encoder, {nn.Linear}, dtype=torch.qint8
+        )
+        self.feedforward = torch.ao.quantization.quantize_dynamic(
+            self.feedforward, {nn.Linear}, dtype=torch.qint8
+        )
+        self.__quantized = True
+
+    def autocast_for_inference(self) -> None:
+        """Predicts in bfloat16 instead of full precision. Ignored if the model is quantized.
+        It is only faster on hardware with native bfloat16 support, and it may
+        slightly change the predicted spans.
+        """
+        self.__autocast = True
+
+    def compile_for_inference(
+        self, mode: str = "reduce-overhead", warmup_lengths: Sequence[int] = (512, 128)
+    ) -> None:
+        """Compiles the encoder and the feed-forward layer with TorchInductor.
+        The CRF layer is left in eager mode because of its control flow.
+        Must be called after any other change to the inference settings, so that
+        the warm-up compiles the same graphs used by the requests.
+
+        Args:
+            mode (str, optional): Compilation mode. Defaults to "reduce-overhead".
+            warmup_lengths (Sequence[int], optional): Sequence lengths used to prime the compilation cache. Defaults to (512, 128).
+        """
+        self.encoder = torch.compile(self.encoder, mode=mode, fullgraph=False)
+        self.feedforward = torch.compile(self.feedforward, mode=mode, fullgraph=False)
+        # Warm-up predictions through the same path of the requests, so that the
+        # first requests do not pay the compilation
+        for length in warmup_lengths:
+            # One unknown token per word, plus the `[CLS]` and `[SEP]` tokens
+            words = [self.__tokenizer.unk_token] * (length - 2)
+            self.predict_batch([" ".join(words)])
+
     @classmethod
     def from_directory(cls, directory: Path) -> "NERAnnotator":
         """Loads the NER annotator from disk.
@@ -124,13 +202,7 @@ class NERAnnotator(LightningModule):
         hparams_file = directory / "hparams.yaml"
         assert hparams_file.is_file()
         # Checkpoint of the model
-        checkpoint = Path(
-            [
-                entry
-                for entry in os.scandir(directory / "checkpoints")
-                if entry.path.endswith("final.ckpt")
-            ][0]
-        )
+        checkpoint = next(directory.glob("checkpoints/*final.ckpt"))
         # Loads the model from disk
         model = NERAnnotator.load_from_checkpoint(
             checkpoint_path=checkpoint, hparams_file=hparams_file
@@ -0,0 +1,92 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from app.model.architecture import NERAnnotator
+from app.schema import Span
+
+
+class PredictionBatcher:
+    """Coalesces concurrent prediction requests into batched forward passes."""
+
+    def __init__(
+        self,
+        model: NERAnnotator,
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+        max_rows: int = 16,
+    ) -> None:
+        """Creates the batcher.
+
+        Args:
+            model (NERAnnotator): Annotation model.
+            max_batch_size (int, optional): Maximum number of texts in a batch. Defaults to 16.
+            max_wait (float, optional): Seconds to wait for other texts after the first one. Defaults to 0.005.
+            max_rows (int, optional): Maximum number of tokenized rows in a forward pass. Defaults to 16.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the background coroutine that consumes the pending texts."""
+        self.__queue = asyncio.Queue()
+        self.__worker = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        """Stops the background coroutine."""
+        self.__worker.cancel()
+        try:
+            await self.__worker
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, text: str) -> List[Span]:
+        """Enqueues a text and waits for its spans.
+
+        Args:
+            text (str): Text to predict.
+
+        Returns:
+            List[Span]: List of spans.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((text, future))
+        return await future
+
+    async def __collect(self) -> List[Tuple[str, asyncio.Future]]:
+        # Waits for the first text, then gathers the others until the deadline
+        batch = [await self.__queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.__collect()
+            texts = [text for text, _ in batch]
+            # Runs the forward pass outside of the event loop
+            try:
+                results = await loop.run_in_executor(
+                    None, self.model.predict_batch, texts, self.max_rows
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            # Gives back to each caller its own spans
+            for (_, future), spans in zip(batch, results):
+                if not future.done():
+                    future.set_result(spans)
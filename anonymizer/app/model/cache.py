@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.schema import Span
+
+
+class PredictionCache:
+    """Bounded LRU cache of the predicted spans, keyed by the hash of the text."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """Creates the cache.
+
+        Args:
+            maxsize (int, optional): Maximum number of cached predictions. Defaults to 1024.
+        """
+        self.maxsize = maxsize
+        self.__entries: OrderedDict[str, List[Span]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[List[Span]]:
+        """Gets the spans of a text, marking them as recently used.
+
+        Args:
+            key (str): Hash of the text.
+
+        Returns:
+            Optional[List[Span]]: Cached spans, if any.
+        """
+        spans = self.__entries.get(key)
+        if spans is not None:
+            self.__entries.move_to_end(key)
+        return spans
+
+    def put(self, key: str, spans: List[Span]) -> None:
+        """Stores the spans of a text, evicting the least recently used ones.
+
+        Args:
+            key (str): Hash of the text.
+            spans (List[Span]): Predicted spans.
+        """
+        self.__entries[key] = spans
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
@@ -1,5 +1,6 @@
 from typing import List, Mapping, Tuple
 
+import numpy as np
 import torch
 from transformers import PreTrainedTokenizer
 
@@ -22,98 +23,96 @@ LABEL2ID: Mapping[str, int] = {
 }
 ID2LABEL: Mapping[int, str] = {idx: label for label, idx in LABEL2ID.items()}
 
+# Label IDs are dense, so the bare labels (without "B-"/"I-") are indexed by ID
+_BARE_LABEL: List[str] = [
+    ID2LABEL[idx][2:] if ID2LABEL[idx] != "O" else "" for idx in range(len(ID2LABEL))
+]
+_O_ID: int = LABEL2ID["O"]
+
 
 def spans_to_labels(
-    spans: List[Span], offsets: List[Tuple[int, int]] | torch.Tensor
+    spans: List[Span], offsets: List[Tuple[int, int]] | torch.Tensor | np.ndarray
 ) -> torch.Tensor:
     """Converts "Prodigy-like" spans to a tensor of encoded integer labels.
 
     Args:
         spans (List[Span]): List of Prodigy spans.
-        offsets (List[Tuple[int, int]] | torch.Tensor): Offset mapping.
+        offsets (List[Tuple[int, int]] | torch.Tensor | np.ndarray): Offset mapping.
         For each token in the document, its (start, end) character offsets.
 
     Returns:
         torch.Tensor: Tensor of encoded labels for each character.
     """
-    label_ids = [LABEL2ID["O"]] * len(offsets)
-    for span in spans:
-        i = 1
-        while i < len(offsets) - 1 and offsets[i][0] < span.start:
-            i += 1
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    label_ids = np.full(len(offsets), _O_ID, dtype=np.int64)
+    if len(spans) == 0 or len(offsets) < 3:
+        return torch.from_numpy(label_ids)
+    # Offsets of the tokens between `[CLS]` and `[SEP]`, sorted by construction
+    starts = offsets[1:-1, 0]
+    ends = offsets[1:-1, 1]
+    span_starts = np.array([span.start for span in spans], dtype=np.int64)
+    span_ends = np.array([span.end for span in spans], dtype=np.int64)
+    # First token starting at or after each span, and first one ending after it
+    first = np.searchsorted(starts, span_starts, side="left")
+    stop = np.maximum(np.searchsorted(ends, span_ends, side="right"), first + 1)
+    for span, i, j in zip(spans, first.tolist(), stop.tolist()):
         # If we reached the last offset we have to continue with the next span
-        if i == len(offsets) - 1:
+        if i == len(starts):
             continue
-        # The target label is reported only in multiclass setting
-        label = span.label
-        # Assigns the "B"-label
-        label_ids[i] = LABEL2ID[f"B-{label}"]
-        i += 1
-        # Assigns the "I"-labels
-        while i < len(offsets) - 1 and offsets[i][1] <= span.end:
-            label_ids[i] = LABEL2ID[f"I-{label}"]
-            i += 1
-    return torch.tensor(label_ids)
+        # Assigns the "B"-label and the "I"-labels, shifted by the `[CLS]` token
+        label_ids[i + 1] = LABEL2ID[f"B-{span.label}"]
+        label_ids[i + 2 : j + 1] = LABEL2ID[f"I-{span.label}"]
+    return torch.from_numpy(label_ids)
 
 
 def labels_to_spans(
-    labels: List[int] | torch.Tensor, offsets: List[Tuple[int, int]] | torch.Tensor
+    labels: List[int] | torch.Tensor | np.ndarray,
+    offsets: List[Tuple[int, int]] | torch.Tensor | np.ndarray,
 ) -> List[Span]:
     """Converts an encoded list of integer labels into a list of "Prodigy-like" spans.
 
     Args:
-        labels (List[int] | torch.Tensor): List or tensor with integer labels.
-        offsets (List[Tuple[int, int]] | torch.Tensor): Offset mapping.
+        labels (List[int] | torch.Tensor | np.ndarray): List, tensor or array with integer labels.
+        offsets (List[Tuple[int, int]] | torch.Tensor | np.ndarray): Offset mapping.
         For each token in the document, its (start, end) character offsets.
 
     Returns:
         List[Span]: List of Prodigy spans.
     """
-    spans = []
-    # Use features of the `List` type.
-    if isinstance(labels, torch.Tensor):
-        labels = labels.tolist()
-    # Removes `[CLS]` and `[SEP]` tokens
-    labels = labels[1:-1]
-    offsets = offsets[1:-1]
-    # Running index over the elements of `labels`
-    i = 0
-    while i < len(labels):
-        # Searches for the start index
-        while i < len(labels) and labels[i] == LABEL2ID["O"]:
-            i += 1
-        # If we reached the end of the list we are over
-        if i == len(labels):
-            break
-        start = int(offsets[i][0])
-        label = ID2LABEL[labels[i]][2:]
-        # Searches for the end index
-        try:
-            i = labels.index(LABEL2ID["O"], i)
-        except ValueError:
-            i = len(labels)
-        end = int(offsets[i - 1][1])
-        # Creates a new span
-        span = Span(start=start, end=end, label=label)
-        spans.append(span)
-    return spans
-
-
-def encode_text(
-    text: str, tokenizer: PreTrainedTokenizer, max_length: int = 512
-) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-    """Encodes text for BERT prediction and training.
+    labels = np.asarray(labels, dtype=np.int8)[1:-1]
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)[1:-1]
+    # Labelled tokens, skipping the empty special tokens of padded rows
+    inside = (labels != _O_ID) & (offsets[:, 1] > offsets[:, 0])
+    # Each run of labelled tokens starts where the mask rises and ends where it falls
+    edges = np.diff(inside.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return [
+        Span(start=start, end=end, label=_BARE_LABEL[label_id])
+        for start, end, label_id in zip(
+            offsets[starts, 0].tolist(),
+            offsets[ends, 1].tolist(),
+            labels[starts].tolist(),
+        )
+    ]
+
+
+def encode_texts(
+    texts: List[str], tokenizer: PreTrainedTokenizer, max_length: int = 512
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Encodes a batch of texts for BERT prediction and training.
 
     Args:
-        text (str): String to encode.
+        texts (List[str]): Strings to encode.
         tokenizer (PreTrainedTokenizer): Tokenizer to use.
         max_length (int, optional): Maximum length of an example. Defaults to 512.
 
     Returns:
-        Tuple[torch.Tensor, torch.Tensor, torch.Tensor]: Input IDs, attention mask and offset mapping.
+        Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]: Input IDs, attention mask,
+        offset mapping and, for each row, the index of the text it comes from.
     """
     output = tokenizer(
-        text,
+        texts,
         padding=True,
         max_length=max_length,
         truncation=True,
@@ -125,4 +124,28 @@ def encode_text(
         return_length=False,
         return_tensors="pt",
     )
-    return output["input_ids"], output["attention_mask"], output["offset_mapping"]
+    return (
+        output["input_ids"],
+        output["attention_mask"],
+        output["offset_mapping"],
+        output["overflow_to_sample_mapping"],
+    )
+
+
+def encode_text(
+    text: str, tokenizer: PreTrainedTokenizer, max_length: int = 512
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Encodes text for BERT prediction and training.
+
+    Args:
+        text (str): String to encode.
+        tokenizer (PreTrainedTokenizer): Tokenizer to use.
+        max_length (int, optional): Maximum length of an example. Defaults to 512.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor, torch.Tensor]: Input IDs, attention mask and offset mapping.
+    """
+    input_ids, attention_mask, offset_mapping, _ = encode_texts(
+        [text], tokenizer, max_length=max_length
+    )
+    return input_ids, attention_mask, offset_mapping
@@ -1,36 +1,101 @@
+import gzip
 from pathlib import Path
-from typing import Iterable, Iterator, Mapping
+from typing import Iterable, Iterator, Mapping, Tuple
+import orjson
 import typer
 import srsly
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import scan, bulk
+from elasticsearch.helpers import scan, parallel_bulk
 
 
 app = typer.Typer()
 
+# Parameters of the parallel bulk upload
+BULK_THREADS = 8
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+
+# Parameters of the connections to Elasticsearch
+ES_MAX_CONNECTIONS = 25
+ES_TIMEOUT = 120
+
+# Compression level of the dumps, fast enough to keep up with the scroll
+GZIP_LEVEL = 3
+
+
+def __connect_elasticsearch(hostname: str, port: int) -> Elasticsearch:
+    return Elasticsearch(
+        hosts=[{"host": hostname, "port": port}],
+        http_compress=True,
+        maxsize=ES_MAX_CONNECTIONS,
+        timeout=ES_TIMEOUT,
+        retry_on_timeout=True,
+    )
+
 
 def __scan_elasticsearch(client: Elasticsearch, index: str) -> Iterator[Mapping]:
-    return scan(client, index=index, preserve_order=True)
+    return scan(client, index=index)
 
 
 def __bulk_elasticsearch(
     client: Elasticsearch, index: str, records: Iterable[Mapping]
-) -> None:
-    return bulk(client, actions=records, index=index)
+) -> Iterator[Tuple[bool, Mapping]]:
+    return parallel_bulk(
+        client,
+        actions=records,
+        index=index,
+        thread_count=BULK_THREADS,
+        chunk_size=BULK_CHUNK_SIZE,
+        max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+        raise_on_error=False,
+    )
+
+
+def __gzip_path(filename: Path) -> Path:
+    if filename.suffix == ".gz":
+        return filename
+    return filename.with_suffix(".jsonl.gz")
+
+
+def __write_jsonl_gz(filename: Path, records: Iterable[Mapping]) -> None:
+    with gzip.open(filename, "wb", compresslevel=GZIP_LEVEL) as file:
+        for record in records:
+            file.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+
+
+def __read_jsonl_gz(filename: Path) -> Iterator[Mapping]:
+    with gzip.open(filename, "rb") as file:
+        for line in file:
+            if line.strip():
+                yield orjson.loads(line)
 
 
 @app.command()
 def download(hostname: str, port: int, index: str, filename: Path) -> None:
-    client = Elasticsearch(hosts=[{"host": hostname, "port": port}])
+    client = __connect_elasticsearch(hostname, port)
     records = __scan_elasticsearch(client, index)
-    srsly.write_jsonl(filename, records)
+    # Streams the records to a compressed JSONL file
+    filename = __gzip_path(filename)
+    __write_jsonl_gz(filename, records)
+    typer.echo(f"Written {filename}")
 
 
 @app.command()
 def upload(hostname: str, port: int, index: str, filename: Path) -> None:
-    client = Elasticsearch(hosts=[{"host": hostname, "port": port}])
-    records = srsly.read_jsonl(filename)
-    __bulk_elasticsearch(client, index, records)
+    client = __connect_elasticsearch(hostname, port)
+    # Reads both compressed and plain JSONL dumps
+    if filename.suffix == ".gz":
+        records = __read_jsonl_gz(filename)
+    else:
+        records = srsly.read_jsonl(filename)
+    # Consumes the lazy parallel upload, reporting the failed documents
+    failed = 0
+    for ok, item in __bulk_elasticsearch(client, index, records):
+        if not ok:
+            failed += 1
+            typer.echo(f"Failed to upload document: {item}", err=True)
+    if failed > 0:
+        typer.echo(f"{failed} documents were not uploaded", err=True)
 
 
 @app.command()
@@ -45,10 +110,8 @@ def test_set(
     avoid_court: str = "Genova",
     max_size: int = 200,
 ) -> None:
-    anonymizer_es = Elasticsearch(
-        hosts=[{"host": anonymizer_host, "port": anonymizer_port}]
-    )
-    search_es = Elasticsearch(hosts=[{"host": search_host, "port": search_port}])
+    anonymizer_es = __connect_elasticsearch(anonymizer_host, anonymizer_port)
+    search_es = __connect_elasticsearch(search_host, search_port)
     # Query to search documents that avoid a certain court
     search_query = {
         "size": max_size,
@@ -1,10 +1,25 @@
+from collections import deque
+from contextlib import contextmanager
 from datetime import date
+from functools import lru_cache
 import os
 from time import time
-from typing import Any, Iterable, List, Mapping, Optional, Tuple
-from elasticsearch import Elasticsearch, ConflictError
-from elasticsearch.exceptions import NotFoundError
-from elasticsearch.helpers import bulk
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+import orjson
+from elasticsearch import AsyncElasticsearch, Elasticsearch, ConflictError
+from elasticsearch.exceptions import NotFoundError, RequestError, SerializationError
+from elasticsearch.serializer import JSONSerializer
+from elasticsearch.helpers import BulkIndexError, parallel_bulk
 
 ES_HOST = os.getenv("SEARCH_ES_HOST")
 ES_PORT = int(os.getenv("SEARCH_ES_PORT"))
@@ -20,13 +35,11 @@ ES_MAPPING_ORDINANCES = {
         "institution": {"type": "keyword"},
         "court": {"type": "keyword"},
         "content": {"type": "text", "analyzer": "italian"},
-        "measures": {
-            "type": "nested",
-            "properties": {
-                "measure": {"type": "keyword"},
-                "outcome": {"type": "boolean"},
-            },
-        },
+        # Measures are only stored, they are searched through the flattened fields
+        "measures": {"type": "object", "enabled": False},
+        "measures_measure": {"type": "keyword"},
+        "measures_outcome": {"type": "boolean"},
+        "measures_pair": {"type": "keyword"},
         "publication_date": {
             "type": "date",
             "format": "yyyy-MM-dd",
@@ -54,11 +67,147 @@ ES_MAPPING_KEYWORDS = {
 }
 
 
+# Writes are refreshed and flushed in the background instead of at every request,
+# while the translog is still synced before acknowledging them
+ES_SETTINGS = {
+    "index": {
+        "refresh_interval": "5s",
+        "translog": {"flush_threshold_size": "1gb", "durability": "request"},
+    }
+}
+
+# Translog durability of a bulk load, which can be repeated if the node crashes
+ES_BULK_DURABILITY = "async"
+
+# Version of the ordinances mapping, in the name of the index created by a migration
+ES_MAPPING_VERSION = 2
+
+# Separator between measure and outcome in the `measures_pair` field
+MEASURE_PAIR_SEPARATOR = "|"
+
+# Maximum number of pooled connections per node
+ES_MAX_CONNECTIONS = 32
+
+# Possible values of the `refresh` parameter of a write
+Refresh = bool | Literal["wait_for"]
+
+
+class ORJSONSerializer(JSONSerializer):
+    """JSON serializer of the Elasticsearch client based on orjson."""
+
+    def loads(self, s: str | bytes) -> Any:
+        try:
+            return orjson.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data: Any) -> str:
+        # Bodies already serialized are sent as they are
+        if isinstance(data, (str, bytes)):
+            return data
+        # Sorted keys make equal requests byte-identical, as the request cache needs
+        try:
+            return orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_SERIALIZE_NUMPY
+                | orjson.OPT_SORT_KEYS,
+            ).decode()
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
+
+@lru_cache(maxsize=None)
+def get_client(host: str = ES_HOST, port: int = ES_PORT) -> Elasticsearch:
+    """Gets the client of an Elasticsearch server, creating it only once per server.
+
+    Args:
+        host (str, optional): Host where to connect. Defaults to ES_HOST.
+        port (int, optional): Port on the host. Defaults to ES_PORT.
+
+    Returns:
+        Elasticsearch: Connection to Elasticsearch
+    """
+    return Elasticsearch(
+        f"http://{host}:{port}",
+        sniff_on_start=True,
+        sniff_on_connection_fail=True,
+        http_compress=True,
+        maxsize=ES_MAX_CONNECTIONS,
+        retry_on_timeout=True,
+        serializer=ORJSONSerializer(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_client(host: str = ES_HOST, port: int = ES_PORT) -> AsyncElasticsearch:
+    """Gets the asynchronous client of an Elasticsearch server, creating it only once per server.
+    Its HTTP session is opened by the first request, inside the running event loop.
+
+    Args:
+        host (str, optional): Host where to connect. Defaults to ES_HOST.
+        port (int, optional): Port on the host. Defaults to ES_PORT.
+
+    Returns:
+        AsyncElasticsearch: Asynchronous connection to Elasticsearch
+    """
+    return AsyncElasticsearch(
+        f"http://{host}:{port}",
+        http_compress=True,
+        maxsize=ES_MAX_CONNECTIONS,
+        retry_on_timeout=True,
+        serializer=ORJSONSerializer(),
+    )
+
+
+def versioned_index(index: str, version: int = ES_MAPPING_VERSION) -> str:
+    """Gets the name of the concrete index behind an alias, for a mapping version.
+
+    Args:
+        index (str): Name of the alias.
+        version (int, optional): Version of the mapping. Defaults to ES_MAPPING_VERSION.
+
+    Returns:
+        str: Name of the versioned index.
+    """
+    return f"{index}_v{version}"
+
+
+def __field_kind(field: Mapping[str, Any]) -> Tuple[str, bool]:
+    # Objects have no explicit type, and they are indexed unless disabled
+    return field.get("type", "object"), field.get("enabled", True)
+
+
+def mapping_mismatches(
+    client: Elasticsearch, index: str, mapping: Mapping[str, Any]
+) -> List[str]:
+    """Compares the live mapping of an index with the expected one.
+
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        index (str): Index or alias to check.
+        mapping (Mapping[str, Any]): Expected mapping.
+
+    Returns:
+        List[str]: Fields missing or with a different type, as "index.field".
+    """
+    mismatches = []
+    for concrete, live in client.indices.get_mapping(index=index).items():
+        properties = live["mappings"].get("properties", {})
+        for field, expected in mapping["properties"].items():
+            actual = properties.get(field)
+            if actual is None or __field_kind(actual) != __field_kind(expected):
+                mismatches.append(f"{concrete}.{field}")
+    return mismatches
+
+
 def connect_elasticsearch(
     host: str = ES_HOST,
     port: int = ES_PORT,
     index: str = ES_INDEX_ORDINANCES,
     mapping: Mapping[str, Any] = ES_MAPPING_ORDINANCES,
+    settings: Mapping[str, Any] = ES_SETTINGS,
 ) -> Elasticsearch:
     """Connects to an Elasticsearch server.
 
@@ -67,21 +216,78 @@ def connect_elasticsearch(
         port (int, optional): Port on the host. Defaults to ES_PORT.
         index (str, optional): Index name to create if it does not exist. Defaults to ES_INDEX.
         mapping (Mapping[str, Any], optional): Mapping of the index. Defaults to ES_MAPPING.
+        settings (Mapping[str, Any], optional): Settings of the index. Defaults to ES_SETTINGS.
+
+    Raises:
+        RuntimeError: If the existing index does not match the mapping.
 
     Returns:
         Elasticsearch: Connection to Elasticsearch
     """
-    # Connects to the ES server
-    client = Elasticsearch(f"http://{host}:{port}", sniff_on_start=True)
+    # Connects to the ES server, reusing the existing connection pool
+    client = get_client(host, port)
     # If the index does not exist, creates it
     if not client.indices.exists(index=index):
-        client.indices.create(index=index, body={"mappings": mapping})
+        try:
+            client.indices.create(
+                index=index, body={"settings": settings, "mappings": mapping}
+            )
+        # Another worker created it in the meantime
+        except RequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+    else:
+        # Refuses to work on an index created with an older mapping
+        mismatches = mapping_mismatches(client, index, mapping)
+        if len(mismatches) > 0:
+            raise RuntimeError(
+                f"Index {index} has an outdated mapping ({', '.join(mismatches)}), "
+                "run migrate_ordinances.py to reindex it."
+            )
+        # Restores the durability of the indices created with asynchronous translogs
+        client.indices.put_settings(
+            index=index, body={"index": {"translog": {"durability": "request"}}}
+        )
     return client
 
 
-def insert_ordinance(
-    client: Elasticsearch,
-    doc_id: str,
+@contextmanager
+def bulk_durability(
+    client: Elasticsearch, index: str, durability: str = ES_BULK_DURABILITY
+) -> Iterator[None]:
+    """Relaxes the translog durability of an index for the duration of a bulk load,
+    then restores the synchronous one, even if the load fails.
+
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        index (str): Index to use.
+        durability (str, optional): Durability during the load. Defaults to ES_BULK_DURABILITY.
+    """
+    client.indices.put_settings(
+        index=index, body={"index": {"translog": {"durability": durability}}}
+    )
+    try:
+        yield
+    finally:
+        client.indices.put_settings(
+            index=index, body={"index": {"translog": {"durability": "request"}}}
+        )
+
+
+def measure_pair(measure: str, outcome: bool) -> str:
+    """Encodes a measure and its outcome as a single keyword.
+
+    Args:
+        measure (str): Measure.
+        outcome (bool): Outcome of the measure.
+
+    Returns:
+        str: Keyword in the form "measure|true" or "measure|false".
+    """
+    return f"{measure}{MEASURE_PAIR_SEPARATOR}{str(outcome).lower()}"
+
+
+def ordinance_body(
     username: str,
     filename: str,
     institution: str,
@@ -94,12 +300,9 @@ def insert_ordinance(
     juridic_entities: List[str],
     publication_date: date,
     timestamp: float = None,
-    index: str = ES_INDEX_ORDINANCES,
-) -> bool:
-    """Puts a document in Elasticsearch if absent.
+) -> Mapping[str, Any]:
+    """Builds the Elasticsearch source of an ordinance.
     Args:
-        client (Elasticsearch): Elasticsearch client.
-        doc_id (str): Document ID.
         username (str): Username of the user.
         filename (str): Name of the file.
         institution (str): Institution that delivered the ordinance.
@@ -112,15 +315,13 @@ def insert_ordinance(
         juridic_entities (List[str]): Entities associated to the juridic keywords.
         publication_date (date): Date of the publication.
         timestamp (float, optional): Timestamp to use. Defaults to None.
-        index (str, optional): Elasticsearch index. Defaults to ES_INDEX_ORDINANCES.
     Returns:
-        bool: If the element have been inserted.
+        Mapping[str, Any]: Source of the document.
     """
     # Computes the timestamp
     if timestamp is None:
         timestamp = int(time())
-    # Inserts the element in the index
-    body = {
+    return {
         "timestamp": timestamp,
         "filename": filename,
         "username": username,
@@ -128,19 +329,102 @@ def insert_ordinance(
         "court": court,
         "content": content,
         "measures": measures,
+        "measures_measure": [entry["measure"] for entry in measures],
+        "measures_outcome": [entry["outcome"] for entry in measures],
+        "measures_pair": [
+            measure_pair(entry["measure"], entry["outcome"]) for entry in measures
+        ],
         "dictionary_keywords": dictionary_keywords,
         "textrank_keywords": textrank_keywords,
         "juridic_keywords": juridic_keywords,
         "juridic_concepts": juridic_entities,
-        "publication_date": publication_date.strftime("%Y-%m-%d"),
+        "publication_date": publication_date.isoformat(),
     }
+
+
+async def insert_ordinance_async(
+    client: AsyncElasticsearch,
+    doc_id: str,
+    body: Mapping[str, Any],
+    index: str = ES_INDEX_ORDINANCES,
+    refresh: Refresh = False,
+) -> bool:
+    """Puts a document in Elasticsearch if absent, without blocking the event loop.
+
+    Args:
+        client (AsyncElasticsearch): Asynchronous Elasticsearch client.
+        doc_id (str): Document ID.
+        body (Mapping[str, Any]): Source of the document (see `ordinance_body`).
+        index (str, optional): Elasticsearch index. Defaults to ES_INDEX_ORDINANCES.
+        refresh (Refresh, optional): If to refresh the index, or "wait_for" the next refresh. Defaults to False.
+
+    Returns:
+        bool: If the element have been inserted.
+    """
     try:
-        client.create(index=index, id=doc_id, body=body, refresh=True)
+        await client.create(index=index, id=doc_id, body=body, refresh=refresh)
         return True
     except ConflictError:
         return False
 
 
+def insert_ordinances(
+    client: Elasticsearch,
+    ordinances: Iterable[Tuple[str, Mapping[str, Any]]],
+    index: str = ES_INDEX_ORDINANCES,
+    chunk_size: int = 500,
+    max_chunk_bytes: int = 50 * 1024 * 1024,
+    thread_count: int = os.cpu_count(),
+    queue_size: int = 4,
+    refresh: Refresh = False,
+) -> Tuple[List[str], List[str]]:
+    """Puts many documents in Elasticsearch if absent, with parallel bulk requests.
+    Args:
+        client (Elasticsearch): Elasticsearch client.
+        ordinances (Iterable[Tuple[str, Mapping[str, Any]]]): Pairs of document ID and source (see `ordinance_body`).
+        index (str, optional): Elasticsearch index. Defaults to ES_INDEX_ORDINANCES.
+        chunk_size (int, optional): Maximum number of documents in a request. Defaults to 500.
+        max_chunk_bytes (int, optional): Maximum size of a request in bytes. Defaults to 50MB.
+        thread_count (int, optional): Number of threads sending the requests. Defaults to the number of CPUs.
+        queue_size (int, optional): Number of requests waiting for a thread. Defaults to 4.
+        refresh (Refresh, optional): If to refresh the index after the last request, or "wait_for" the next refresh at every request. Defaults to False.
+    Raises:
+        BulkIndexError: If some document failed for reasons other than already existing.
+    Returns:
+        Tuple[List[str], List[str]]: IDs of the inserted documents and of the already existing ones.
+    """
+    actions = (
+        {"_op_type": "create", "_index": index, "_id": doc_id, "_source": body}
+        for doc_id, body in ordinances
+    )
+    inserted, conflicts, errors = [], [], []
+    for ok, item in parallel_bulk(
+        client,
+        actions,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        thread_count=thread_count,
+        queue_size=queue_size,
+        raise_on_error=False,
+        # With "wait_for", each request waits until its documents are visible
+        refresh="wait_for" if refresh == "wait_for" else False,
+    ):
+        info = item["create"]
+        if ok:
+            inserted.append(info["_id"])
+        # The document already exists
+        elif info.get("status") == 409:
+            conflicts.append(info["_id"])
+        else:
+            errors.append(item)
+    # Makes the new documents visible all at once
+    if refresh is True:
+        client.indices.refresh(index=index)
+    if len(errors) > 0:
+        raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+    return inserted, conflicts
+
+
 def retrieve_ordinance(
     client: Elasticsearch, doc_id: str, index: str = ES_INDEX_ORDINANCES
 ) -> Optional[Mapping[str, Any]]:
@@ -159,19 +443,71 @@ def retrieve_ordinance(
         return None
 
 
+def retrieve_ordinances(
+    client: Elasticsearch, doc_ids: List[str], index: str = ES_INDEX_ORDINANCES
+) -> List[Optional[Mapping[str, Any]]]:
+    """Retrieves many documents on Elasticsearch with a single request.
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        doc_ids (List[str]): Document IDs.
+        index (str, optional): Index on Elasticsearch. Defaults to ES_INDEX.
+    Returns:
+        List[Optional[Mapping[str, Any]]]: The documents in the same order of the IDs, None if not found.
+    """
+    if len(doc_ids) == 0:
+        return []
+    result = client.mget(index=index, body={"ids": doc_ids})
+    return [doc["_source"] if doc["found"] else None for doc in result["docs"]]
+
+
+def existing_ordinances(
+    client: Elasticsearch, doc_ids: List[str], index: str = ES_INDEX_ORDINANCES
+) -> Set[str]:
+    """Finds which documents already exist on Elasticsearch, without fetching them.
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        doc_ids (List[str]): Document IDs.
+        index (str, optional): Index on Elasticsearch. Defaults to ES_INDEX.
+    Returns:
+        Set[str]: IDs of the existing documents.
+    """
+    if len(doc_ids) == 0:
+        return set()
+    result = client.mget(index=index, body={"ids": doc_ids}, _source=False)
+    return {doc["_id"] for doc in result["docs"] if doc["found"]}
+
+
+async def ordinance_exists_async(
+    client: AsyncElasticsearch, doc_id: str, index: str = ES_INDEX_ORDINANCES
+) -> bool:
+    """Checks if a document exists on Elasticsearch, without blocking the event loop.
+    Args:
+        client (AsyncElasticsearch): Asynchronous connection to Elasticsearch.
+        doc_id (str): Document ID.
+        index (str, optional): Index on Elasticsearch. Defaults to ES_INDEX.
+    Returns:
+        bool: If the document exists.
+    """
+    return await client.exists(index=index, id=doc_id)
+
+
 def remove_ordinance(
-    client: Elasticsearch, doc_id: str, index: str = ES_INDEX_ORDINANCES
+    client: Elasticsearch,
+    doc_id: str,
+    index: str = ES_INDEX_ORDINANCES,
+    refresh: Refresh = False,
 ) -> bool:
     """Deletes a document on the Elasticsearch index.
     Args:
         client (Elasticsearch): Connection to Elasticsearch.
         doc_id (str): Document ID.
         index (str, optional): Index on Elasticsearch. Defaults to ES_INDEX.
+        refresh (Refresh, optional): If to refresh the index, or "wait_for" the next refresh. Defaults to False.
     Returns:
         bool: If the deletion actually deleted the document.
     """
     try:
-        client.delete(index=index, id=doc_id, refresh=True)
+        client.delete(index=index, id=doc_id, refresh=refresh)
         return True
     except NotFoundError:
         return False
@@ -192,20 +528,41 @@ def is_index_populated(client: Elasticsearch, index: str) -> bool:
 
 
 def bulk_upload(
-    client: Elasticsearch, records: Iterable[Mapping[str, str]], index: str
+    client: Elasticsearch,
+    records: Iterable[Mapping[str, str]],
+    index: str,
+    chunk_size: int = 500,
+    thread_count: int = os.cpu_count(),
+    queue_size: int = 4,
 ) -> None:
-    """Performs a bulk upload on an Elasticsearch server.
+    """Performs a bulk upload on an Elasticsearch server, with parallel requests.
 
     Args:
         client (Elasticsearch): Connection to Elasticsearch.
-        records (Iterable[Mapping[str, str]]): Records to store.
+        records (Iterable[Mapping[str, str]]): Records to store, consumed lazily.
         index (str): Index to use.
-        type (str): Type of records. Defaults to "_doc".
+        chunk_size (int, optional): Maximum number of records in a request. Defaults to 500.
+        thread_count (int, optional): Number of threads sending the requests. Defaults to the number of CPUs.
+        queue_size (int, optional): Number of requests waiting for a thread. Defaults to 4.
+
+    Raises:
+        BulkIndexError: If some record failed to index.
     """
-    bulk(
-        client,
-        ({"_index": index, "_type": "_doc", "_source": record} for record in records),
+    actions = (
+        {"_index": index, "_type": "_doc", "_source": record} for record in records
     )
+    # Consumes the results, which raises at the first failed request
+    with bulk_durability(client, index):
+        deque(
+            parallel_bulk(
+                client,
+                actions,
+                chunk_size=chunk_size,
+                thread_count=thread_count,
+                queue_size=queue_size,
+            ),
+            maxlen=0,
+        )
 
 
 def retrieve_juridic_data(
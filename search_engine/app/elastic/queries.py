@@ -1,25 +1,165 @@
+import asyncio
+from collections import defaultdict
 from datetime import date
-from typing import List, Mapping, Tuple
-from elasticsearch import Elasticsearch
-from app.elastic.db import ES_INDEX_ORDINANCES, ES_INDEX_KEYWORDS
+import logging
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+import orjson
+from elasticsearch import AsyncElasticsearch, Elasticsearch, TransportError
+from app.elastic.db import (
+    ES_INDEX_ORDINANCES,
+    ES_INDEX_KEYWORDS,
+    MEASURE_PAIR_SEPARATOR,
+    Refresh,
+    measure_pair,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of hits counted exactly by a query
+MAX_TRACKED_HITS = 10_000
+
+# Number of buckets in a page of a composite aggregation
+COMPOSITE_PAGE_SIZE = 1000
+
+# Keys of the (institution, court, year, measure and outcome) rollup for the map view
+ROLLUP_SOURCES = [
+    {"institution": {"terms": {"field": "institution"}}},
+    {"court": {"terms": {"field": "court"}}},
+    {
+        "year": {
+            "date_histogram": {
+                "field": "publication_date",
+                "calendar_interval": "year",
+                "format": "yyyy",
+            }
+        }
+    },
+    {"pair": {"terms": {"field": "measures_pair", "missing_bucket": True}}},
+]
+
+# Fields of the ordinances returned as hits
+HIT_FIELDS = [
+    "institution",
+    "content",
+    "court",
+    "measures",
+    "publication_date",
+    "dictionary_keywords",
+    "textrank_keywords",
+    "juridic_keywords",
+    "juridic_concepts",
+]
+
+# Aggregations of the query, the same for every request (only read, never mutated)
+ROLLUP_AGGS = {
+    "rollup": {"composite": {"size": COMPOSITE_PAGE_SIZE, "sources": ROLLUP_SOURCES}}
+}
+JURIDIC_AGGS = {
+    "keywords": {
+        "composite": {
+            "size": COMPOSITE_PAGE_SIZE,
+            "sources": [{"keyword": {"terms": {"field": "juridic_keywords"}}}],
+        }
+    },
+    "concepts": {
+        "composite": {
+            "size": COMPOSITE_PAGE_SIZE,
+            "sources": [{"concept": {"terms": {"field": "juridic_concepts"}}}],
+        }
+    },
+}
+
+
+def __next_page(
+    body: Mapping[str, Any], name: str, aggregation: Mapping[str, Any]
+) -> Optional[Mapping[str, Any]]:
+    # Body of the next page of a composite aggregation, None after the last one
+    composite = body["aggs"][name]["composite"]
+    if (
+        "after_key" not in aggregation
+        or len(aggregation["buckets"]) < composite["size"]
+    ):
+        return None
+    # The next page only needs this aggregation
+    composite = {**composite, "after": aggregation["after_key"]}
+    return {**body, "aggs": {name: {"composite": composite}}}
+
+
+async def __composite_buckets_async(
+    client: AsyncElasticsearch,
+    index: str,
+    body: Mapping[str, Any],
+    name: str,
+    response: Mapping[str, Any],
+) -> List[Mapping[str, Any]]:
+    # Collects the buckets of a composite aggregation, awaiting the following pages
+    buckets = []
+    while True:
+        aggregation = response["aggregations"][name]
+        buckets.extend(aggregation["buckets"])
+        body = __next_page(body, name, aggregation)
+        if body is None:
+            return buckets
+        response = await client.search(body=body, index=index, request_cache=True)
+
+
+def __decode_cursor(cursor: str) -> List[Any]:
+    # Sort values of the last hit of a page: timestamp and document ID
+    try:
+        values = orjson.loads(cursor)
+    except orjson.JSONDecodeError:
+        raise ValueError("The cursor is not valid JSON.")
+    if (
+        not isinstance(values, list)
+        or len(values) != 2
+        or not isinstance(values[0], int)
+        or isinstance(values[0], bool)
+        or not isinstance(values[1], str)
+    ):
+        raise ValueError("The cursor is not a [timestamp, document ID] pair.")
+    return values
 
 
 def retrieve_ordinances_user(
     client: Elasticsearch,
     username: str,
-    search_from: int,
+    cursor: Optional[str] = None,
+    page_size: int = 10,
     index: str = ES_INDEX_ORDINANCES,
-) -> List[Mapping]:
+) -> Tuple[List[Mapping], Optional[str]]:
+    """Lists the ordinances of a user, newest first, one page at a time.
+
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        username (str): Username of the user.
+        cursor (Optional[str], optional): Cursor returned with the previous page. Defaults to None.
+        page_size (int, optional): Number of ordinances in a page. Defaults to 10.
+        index (str, optional): Index name. Defaults to ES_INDEX_ORDINANCES.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        Tuple[List[Mapping], Optional[str]]: Ordinances in the page and cursor of the next one, if any.
+    """
     body = {
         "query": {"term": {"username": username}},
-        "sort": {"timestamp": "desc"},
-        "from": search_from,
+        # The ID breaks the ties, so that the cursor is unique
+        "sort": [{"timestamp": "desc"}, {"_id": "asc"}],
+        "size": page_size,
+        "track_total_hits": False,
     }
+    if cursor is not None:
+        body["search_after"] = __decode_cursor(cursor)
     results = client.search(body=body, index=index)
-    return [
-        {"doc_id": result["_id"], **result["_source"]}
-        for result in results["hits"]["hits"]
-    ]
+    hits = results["hits"]["hits"]
+    ordinances = [{"doc_id": hit["_id"], **hit["_source"]} for hit in hits]
+    # A full page may be followed by another one
+    next_cursor = None
+    if len(hits) == page_size:
+        next_cursor = orjson.dumps(hits[-1]["sort"]).decode()
+    return ordinances, next_cursor
 
 
 def stats_ordinances(client: Elasticsearch, index: str = ES_INDEX_ORDINANCES) -> int:
@@ -32,12 +172,13 @@ def stats_ordinances(client: Elasticsearch, index: str = ES_INDEX_ORDINANCES) ->
     Returns:
         int: Number of documents.
     """
-    # Simple count of distinct documents
-    return client.count(index=index)["count"]
+    # Exact count without hits, cheap and cacheable by the shard request cache
+    body = {"size": 0, "track_total_hits": True}
+    response = client.search(body=body, index=index, request_cache=True)
+    return response["hits"]["total"]["value"]
 
 
-def query_ordinances(
-    client: Elasticsearch,
+def __query_bodies(
     start_date: date,
     end_date: date,
     text: str | None,
@@ -47,210 +188,287 @@ def query_ordinances(
     courts: List[str] | None,
     measures: List[str] | None,
     outcome: bool | None,
-    index: str = ES_INDEX_ORDINANCES,
     fields: List[str] = None,
     pre_tag: str = "<b>",
     post_tag: str = "</b>",
     fragment_size: int = 150,
-):
+    number_of_fragments: int = 3,
+    no_match_size: int = 250,
+) -> Tuple[Mapping[str, Any], Mapping[str, Any], Mapping[str, Any]]:
     # Default document fields
     if fields is None:
-        fields = [
-            "institution",
-            "content",
-            "court",
-            "measures",
-            "publication_date",
-            "dictionary_keywords",
-            "textrank_keywords",
-            "juridic_keywords",
-            "juridic_concepts",
-        ]
-    # Query body with aggregation
-    body = {
-        "query": {"bool": {}},
-        "highlight": {
-            "fields": {"content": {}},
-            "pre_tags": [pre_tag],
-            "post_tags": [post_tag],
-            "fragment_size": fragment_size,
-        },
-        "aggs": {
-            "keywords": {"terms": {"field": "juridic_keywords", "size": 100_000}},
-            "concepts": {"terms": {"field": "juridic_concepts", "size": 100_000}},
-            "by_institution": {
-                "terms": {"field": "institution"},
-                "aggs": {
-                    "by_court": {
-                        "terms": {"field": "court"},
-                        "aggs": {
-                            "by_year": {
-                                "date_histogram": {
-                                    "field": "publication_date",
-                                    "calendar_interval": "year",
-                                },
-                                "aggs": {
-                                    "nested_measure": {
-                                        "nested": {"path": "measures"},
-                                        "aggs": {
-                                            "by_measure": {
-                                                "terms": {"field": "measures.measure"},
-                                                "aggs": {
-                                                    "by_outcome": {
-                                                        "terms": {
-                                                            "field": "measures.outcome"
-                                                        }
-                                                    }
-                                                },
-                                            }
-                                        },
-                                    }
-                                },
-                            }
-                        },
-                    }
-                },
-            },
-        },
-        "_source": fields,
-    }
+        fields = HIT_FIELDS
+    # Query shared by the hits and the aggregations
+    query = {"bool": {}}
     if text is not None:
         # Query is a simple multi-match on the weighted fields
-        body["query"]["bool"]["must"] = {"match": {"content": text}}
+        query["bool"]["must"] = {"match": {"content": text}}
     # If provided, adds some filters
     filters = [
         {
             "range": {
                 "publication_date": {
-                    "gte": start_date.strftime("%Y-%m-%d"),
-                    "lte": end_date.strftime("%Y-%m-%d"),
+                    "gte": start_date.isoformat(),
+                    "lte": end_date.isoformat(),
                 }
             }
         }
     ]
+    # Every keyword and concept is required, each one as a standalone cacheable filter
     if keywords is not None:
-        filters.append(
-            {"bool": {"must": [{"term": {"juridic_keywords": kw}} for kw in keywords]}}
-        )
+        filters.extend({"term": {"juridic_keywords": kw}} for kw in keywords)
     if concepts is not None:
-        filters.append(
-            {"bool": {"must": [{"term": {"juridic_concepts": cp}} for cp in concepts]}}
-        )
+        filters.extend({"term": {"juridic_concepts": cp}} for cp in concepts)
     if courts is not None:
         filters.append({"terms": {"court": courts}})
     if institution is not None:
         filters.append({"term": {"institution": institution}})
-    if measures is not None or outcome is not None:
-        nested_filters = []
-        if measures is not None:
-            nested_filters.append({"terms": {"measures.measure": measures}})
-        if outcome is not None:
-            nested_filters.append({"term": {"measures.outcome": outcome}})
+    # Measure and outcome must belong to the same entry, hence the pairs
+    if measures is not None and outcome is not None:
         filters.append(
-            {
-                "nested": {
-                    "path": "measures",
-                    "query": {"bool": {"must": nested_filters}},
-                }
-            }
+            {"terms": {"measures_pair": [measure_pair(m, outcome) for m in measures]}}
         )
+    elif measures is not None:
+        filters.append({"terms": {"measures_measure": measures}})
+    elif outcome is not None:
+        filters.append({"term": {"measures_outcome": outcome}})
     if len(filters) > 0:
-        body["query"]["bool"]["filter"] = filters
-    print(body, flush=True)
-    # Performs the query
-    response = client.search(body=body, index=index)
+        query["bool"]["filter"] = filters
+    # Aggregations do not need scores, so all the clauses become cacheable filters
+    aggs_query = {
+        "bool": {"filter": filters + ([] if text is None else [query["bool"]["must"]])}
+    }
+    # Hits with highlights (for list view)
+    hits_body = {
+        "query": query,
+        # Counts the hits exactly up to a bound, beyond which it is a lower bound
+        "track_total_hits": MAX_TRACKED_HITS,
+        "highlight": {
+            "fields": {
+                "content": {
+                    "number_of_fragments": number_of_fragments,
+                    # Without a match, the snippet is the beginning of the text
+                    "no_match_size": no_match_size,
+                }
+            },
+            "pre_tags": [pre_tag],
+            "post_tags": [post_tag],
+            "fragment_size": fragment_size,
+        },
+        "_source": fields,
+    }
+    # Flat rollup of the measures (for map view)
+    map_body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": aggs_query,
+        "aggs": ROLLUP_AGGS,
+    }
+    # Juridic keywords and concepts of the results
+    juridic_body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": aggs_query,
+        "aggs": JURIDIC_AGGS,
+    }
+    return hits_body, map_body, juridic_body
+
+
+def __msearch_body(
+    index: str,
+    hits_body: Mapping[str, Any],
+    map_body: Mapping[str, Any],
+    juridic_body: Mapping[str, Any],
+) -> List[Mapping[str, Any]]:
+    # Sends the three independent searches in a single request, caching the aggregations
+    body = [
+        {"index": index},
+        hits_body,
+        {"index": index, "request_cache": True},
+        map_body,
+        {"index": index, "request_cache": True},
+        juridic_body,
+    ]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Query body: %s", body)
+    return body
+
+
+def __collect_results(
+    hits_response: Mapping[str, Any],
+    rollup_buckets: Iterable[Mapping[str, Any]],
+    keyword_buckets: Iterable[Mapping[str, Any]],
+    concept_buckets: Iterable[Mapping[str, Any]],
+):
     # Collects the hits (for list view)
     hits = []
-    for hit in response["hits"]["hits"]:
+    for hit in hits_response["hits"]["hits"]:
+        # Only the short snippets are converted to HTML, empty contents have none
         if "highlight" in hit:
             highlight = " ".join(hit["highlight"]["content"]).replace("\n", "<br/>")
-        # If there is nothing to align gets to the first space after 250 chars
         else:
             highlight = "..."
         hits.append({"highlight": highlight, **hit["_source"]})
-    # Collects the aggregations (for map view)
-    aggregations = dict()
-    for institution in response["aggregations"]["by_institution"]["buckets"]:
-        institution_key = institution["key"]
-        courts = dict()
-        for court in institution["by_court"]["buckets"]:
-            court_key = court["key"]
-            years = dict()
-            for year in court["by_year"]["buckets"]:
-                year_number = int(year["key_as_string"].split("-", maxsplit=1)[0])
-                year_count = year["doc_count"]
-                # Skips un-meaningful years
-                if year_count == 0:
-                    continue
-                measures = dict()
-                for measure in year["nested_measure"]["by_measure"]["buckets"]:
-                    measure_key = measure["key"]
-                    outcomes = {"true": 0, "false": 0}
-                    for outcome in measure["by_outcome"]["buckets"]:
-                        outcome_key = outcome["key_as_string"]
-                        outcome_count = outcome["doc_count"]
-                        outcomes[outcome_key] = outcome_count
-                    measures[measure_key] = outcomes
-                years[year_number] = measures
-            courts[court_key] = years
-        aggregations[institution_key] = courts
+    # Collects the aggregations (for map view), nesting the flat rollup
+    # Institution -> court -> year -> measure -> outcome -> count
+    aggregations = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(lambda: {"true": 0, "false": 0}))
+    )
+    for bucket in rollup_buckets:
+        key = bucket["key"]
+        measures = aggregations[key["institution"]][key["court"]][int(key["year"])]
+        # Ordinances without measures only account for the year
+        if key["pair"] is None:
+            continue
+        measure_key, outcome_key = key["pair"].rsplit(
+            MEASURE_PAIR_SEPARATOR, maxsplit=1
+        )
+        measures[measure_key][outcome_key] += bucket["doc_count"]
     # Collects juridic keywords and concepts
-    keywords = [
-        bucket["key"] for bucket in response["aggregations"]["keywords"]["buckets"]
-    ]
-    concepts = [
-        bucket["key"] for bucket in response["aggregations"]["concepts"]["buckets"]
-    ]
+    keywords = [bucket["key"]["keyword"] for bucket in keyword_buckets]
+    concepts = [bucket["key"]["concept"] for bucket in concept_buckets]
     # Collects the number of hits
-    num_hits = response["hits"]["total"]["value"]
+    num_hits = hits_response["hits"]["total"]["value"]
     return aggregations, hits, keywords, concepts, num_hits
 
 
+async def query_ordinances_async(
+    client: AsyncElasticsearch,
+    start_date: date,
+    end_date: date,
+    text: str | None,
+    keywords: List[str] | None,
+    concepts: List[str] | None,
+    institution: List[str] | None,
+    courts: List[str] | None,
+    measures: List[str] | None,
+    outcome: bool | None,
+    index: str = ES_INDEX_ORDINANCES,
+    fields: List[str] = None,
+    pre_tag: str = "<b>",
+    post_tag: str = "</b>",
+    fragment_size: int = 150,
+    number_of_fragments: int = 3,
+    no_match_size: int = 250,
+):
+    hits_body, map_body, juridic_body = __query_bodies(
+        start_date=start_date,
+        end_date=end_date,
+        text=text,
+        keywords=keywords,
+        concepts=concepts,
+        institution=institution,
+        courts=courts,
+        measures=measures,
+        outcome=outcome,
+        fields=fields,
+        pre_tag=pre_tag,
+        post_tag=post_tag,
+        fragment_size=fragment_size,
+        number_of_fragments=number_of_fragments,
+        no_match_size=no_match_size,
+    )
+    body = __msearch_body(index, hits_body, map_body, juridic_body)
+    # Performs the query without blocking the event loop
+    responses = (await client.msearch(body=body))["responses"]
+    if any("error" in response for response in responses):
+        return None
+    hits_response, map_response, juridic_response = responses
+    # Pages through the three aggregations concurrently
+    rollup_buckets, keyword_buckets, concept_buckets = await asyncio.gather(
+        __composite_buckets_async(client, index, map_body, "rollup", map_response),
+        __composite_buckets_async(
+            client, index, juridic_body, "keywords", juridic_response
+        ),
+        __composite_buckets_async(
+            client, index, juridic_body, "concepts", juridic_response
+        ),
+    )
+    return __collect_results(
+        hits_response, rollup_buckets, keyword_buckets, concept_buckets
+    )
+
+
 def edit_publication_date(
     client: Elasticsearch,
     doc_id: str,
     publication_date: date,
     index: str = ES_INDEX_ORDINANCES,
+    refresh: Refresh = False,
 ) -> None:
     # Updates the publication date of a certain document.
     try:
         client.update(
             id=doc_id,
             index=index,
-            body={"doc": {"publication_date": publication_date.strftime("%Y-%m-%d")}},
-            refresh=True,
+            body={"doc": {"publication_date": publication_date.isoformat()}},
+            refresh=refresh,
         )
         return True
     except:
         return False
 
 
+def extract_keywords_batch(
+    client: Elasticsearch,
+    documents: List[Tuple[str, List[Mapping]]],
+    index: str = ES_INDEX_KEYWORDS,
+) -> List[Tuple[List[str], List[str]]]:
+    """Extracts the juridic keywords and entities of many documents with a single request.
+
+    Args:
+        client (Elasticsearch): Connection to Elasticsearch.
+        documents (List[Tuple[str, List[Mapping]]]): Pairs of content and measures of each document.
+        index (str, optional): Index of the percolator queries. Defaults to ES_INDEX_KEYWORDS.
+
+    Returns:
+        List[Tuple[List[str], List[str]]]: Keywords and entities of each document, in the same order.
+    """
+    if len(documents) == 0:
+        return []
+    # One percolation and keyword extraction for each document
+    body = []
+    for content, measures in documents:
+        body.append({"index": index})
+        body.append(
+            {
+                "size": 0,
+                "track_total_hits": False,
+                "query": {
+                    "percolate": {
+                        "field": "query",
+                        "document": {"content": content, "measures": measures},
+                    }
+                },
+                "aggs": {
+                    "keywords": {"terms": {"field": "keyword.keyword"}},
+                    "entities": {"terms": {"field": "entity.keyword"}},
+                },
+            }
+        )
+    responses = client.msearch(body=body)["responses"]
+    # Collects the results
+    results = []
+    for response in responses:
+        if "error" in response:
+            raise TransportError(
+                response.get("status", "N/A"), response["error"].get("type"), response
+            )
+        keywords = [
+            bucket["key"] for bucket in response["aggregations"]["keywords"]["buckets"]
+        ]
+        entities = [
+            bucket["key"] for bucket in response["aggregations"]["entities"]["buckets"]
+        ]
+        results.append((keywords, entities))
+    return results
+
+
 def extract_keywords(
     client: Elasticsearch,
     content: str,
     measures: List[Mapping],
     index: str = ES_INDEX_KEYWORDS,
 ) -> Tuple[List[str], List[str]]:
-    # Query for percolation and keyword extraction
-    body = {
-        "size": 0,
-        "query": {
-            "percolate": {
-                "field": "query",
-                "document": {"content": content, "measures": measures},
-            }
-        },
-        "aggs": {
-            "keywords": {"terms": {"field": "keyword.keyword"}},
-            "entities": {"terms": {"field": "entity.keyword"}},
-        },
-    }
-    response = client.search(body=body, index=index)
-    # Collects the results
-    keywords = [
-        bucket["key"] for bucket in response["aggregations"]["keywords"]["buckets"]
-    ]
-    entities = [
-        bucket["key"] for bucket in response["aggregations"]["entities"]["buckets"]
-    ]
-    return keywords, entities
+    # Percolation of a single document
+    return extract_keywords_batch(client, [(content, measures)], index=index)[0]
@@ -0,0 +1,123 @@
+from functools import lru_cache
+from hashlib import blake2b
+from itertools import count
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import List, Optional, Tuple
+import orjson
+
+
+class KeywordsCache:
+    """Cache of the TextRank keywords, keyed by the hash of the content and of the
+    pipeline that computed them. Entries are kept on disk, shared by the workers,
+    with the most recently used ones also kept in memory. The least recently used
+    files are evicted when the directory grows over its limit.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        pipeline: str = "",
+        max_entries: int = 100_000,
+        memory_entries: int = 4096,
+        eviction_period: int = 256,
+    ) -> None:
+        """Creates the cache, and its directory if it does not exist.
+
+        Args:
+            directory (Path): Directory of the cached keywords.
+            pipeline (str, optional): Description of the pipeline computing the keywords,
+            so that a different pipeline never reads them. Defaults to "".
+            max_entries (int, optional): Maximum number of files on disk. Defaults to 100_000.
+            memory_entries (int, optional): Maximum number of entries in memory. Defaults to 4096.
+            eviction_period (int, optional): Insertions between two checks of the directory size. Defaults to 256.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.pipeline = pipeline.encode("utf-8")
+        self.max_entries = max_entries
+        self.eviction_period = eviction_period
+        self.__insertions = count(1)
+        self.__eviction_lock = Lock()
+        # Misses raise, so that only the entries found are kept in memory
+        self.__load = lru_cache(maxsize=memory_entries)(self.__read)
+
+    def __path(self, content: str) -> Path:
+        # File named after the 128-bit digest of the pipeline and of the content
+        digest = blake2b(self.pipeline, digest_size=16)
+        digest.update(b"\0")
+        digest.update(content.encode("utf-8"))
+        return self.directory / f"{digest.hexdigest()}.json"
+
+    def __read(self, path: Path) -> Tuple[str, ...]:
+        keywords = tuple(orjson.loads(path.read_bytes()))
+        # Marks the file as recently used, for the eviction
+        os.utime(path)
+        return keywords
+
+    def get(self, content: str) -> Optional[List[str]]:
+        """Gets the keywords of a content.
+
+        Args:
+            content (str): Content of the ordinance.
+
+        Returns:
+            Optional[List[str]]: Cached keywords, if any.
+        """
+        # Missing, evicted, truncated or corrupt files are all misses
+        try:
+            return list(self.__load(self.__path(content)))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def put(self, content: str, keywords: List[str]) -> None:
+        """Stores the keywords of a content.
+
+        Args:
+            content (str): Content of the ordinance.
+            keywords (List[str]): TextRank keywords.
+        """
+        path = self.__path(content)
+        # Writes a uniquely named temporary file, then renames it so that readers
+        # never see half of it. A failed write only loses the entry
+        temporary = None
+        try:
+            with NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as temporary:
+                temporary.write(orjson.dumps(keywords))
+            os.replace(temporary.name, path)
+        except OSError:
+            if temporary is not None and os.path.exists(temporary.name):
+                os.unlink(temporary.name)
+            return
+        if next(self.__insertions) % self.eviction_period == 0:
+            self.__evict()
+
+    def __evict(self) -> None:
+        # A single thread per process scans the directory, the others skip it
+        if not self.__eviction_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+            if len(entries) <= self.max_entries:
+                return
+            # Removes the least recently used files, leaving room for the next insertions
+            entries.sort()
+            excess = len(entries) - self.max_entries + self.eviction_period
+            for _, path in entries[:excess]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+        finally:
+            self.__eviction_lock.release()
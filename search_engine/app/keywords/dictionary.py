@@ -1,8 +1,7 @@
 from collections import Counter
-import heapq
 from pathlib import Path
 import re
-from typing import List, Set
+from typing import List
 from flashtext import KeywordProcessor
 
 
@@ -16,7 +15,10 @@ def load_juridic_dictionary(filename: Path) -> KeywordProcessor:
         KeywordProcessor: SProcessor able to extract keywords.
     """
     extractor = KeywordProcessor()
-    extractor.add_keyword_from_file(filename)
+    # Reads the whole file at once, then adds each "keyword" or "keyword => clean name"
+    for line in Path(filename).read_text(encoding="utf-8").splitlines():
+        keyword, _, clean_name = line.partition("=>")
+        extractor.add_keyword(keyword.strip(), clean_name.strip() or None)
     return extractor
 
 
@@ -33,10 +35,8 @@ def detect_juridic_keywords(
     Returns:
         List[str]: List of juridic keywords.
     """
-    # Set of all the distinct keywords
-    keywords: Set[str] = set(extractor.extract_keywords(text))
+    # Occurrences of each keyword, counted in the same pass that finds them
+    counts: Counter[str] = Counter(extractor.extract_keywords(text))
     # Top-k Keyword-occurrences pairs
-    top_keywords: List[str] = heapq.nlargest(
-        size, keywords, key=lambda kw: text.lower().count(kw.lower())
-    )
+    top_keywords: List[str] = [kw for kw, _ in counts.most_common(size)]
     return top_keywords
@@ -1,10 +1,24 @@
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Set
+import re
+from typing import FrozenSet, List, Set
 import heapq
 import spacy
 import pytextrank
 
 
+# Substrings excluding a TextRank phrase: anonymization labels and articles of law
+FILTERED_SUBSTRINGS: FrozenSet[str] = frozenset(
+    {"ORG", "PER", "LOC", "MISC", "TIME", "DOTT", "art.", "artt."}
+)
+
+
+@lru_cache(maxsize=8)
+def __filter_regex(filtered: FrozenSet[str]) -> re.Pattern:
+    # Single alternation matching any of the filtered substrings, never matching if none
+    return re.compile("|".join(re.escape(f) for f in filtered) or "(?!)")
+
+
 @spacy.language.Language.component("custom_sents_bounds")
 def set_custom_boundaries(doc: spacy.language.Doc) -> spacy.language.Doc:
     for tok in doc[:-1]:
@@ -27,7 +41,8 @@ def load_spacy_model(spacy_model: str = "it_core_news_sm") -> spacy.language.Lan
     Returns:
         spacy.language.Language: SpaCy model.
     """
-    # Loads the base NLP model
+    # Loads the base NLP model, keeping the named entities: TextRank ranks them
+    # as phrases together with the noun chunks
     nlp = spacy.load(spacy_model)
     # Adds the custom sentence boundary recognizer
     nlp.add_pipe("custom_sents_bounds", before="parser")
@@ -36,6 +51,18 @@ def load_spacy_model(spacy_model: str = "it_core_news_sm") -> spacy.language.Lan
     return nlp
 
 
+def pipeline_signature(nlp: spacy.language.Language) -> str:
+    """Describes the model and the components of a SpaCy pipeline.
+
+    Args:
+        nlp (spacy.language.Language): SpaCy model.
+
+    Returns:
+        str: Name and version of the model, followed by its components.
+    """
+    return f"{nlp.meta['name']}-{nlp.meta['version']}:{','.join(nlp.pipe_names)}"
+
+
 def detect_textrank_keywords(
     doc: spacy.language.Doc, size: int = 10, filtered: Set[str] = None
 ) -> List[str]:
@@ -50,13 +77,14 @@ def detect_textrank_keywords(
         List[str]: List of top-k keywords found via TextRank.
     """
     if filtered is None:
-        filtered = {"ORG", "PER", "LOC", "MISC", "TIME", "DOTT", "art.", "artt."}
+        filtered = FILTERED_SUBSTRINGS
+    regex = __filter_regex(frozenset(filtered))
     chunks = heapq.nlargest(
         size,
         (
             chunk
             for chunk in doc._.phrases
-            if not any(f in chunk.text for f in filtered) and len(chunk.text) <= 20
+            if len(chunk.text) <= 20 and regex.search(chunk.text) is None
         ),
         key=lambda chunk: chunk.rank,
     )
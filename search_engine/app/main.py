@@ -1,55 +1,158 @@
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import date
+from functools import lru_cache
 import os
 from pathlib import Path
-from typing import List, Mapping, Set
+from typing import AsyncIterator, List, Mapping, Optional
 from fastapi import FastAPI, status, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from flashtext import KeywordProcessor
 import spacy
 
 from app.schema import (
+    INSTITUTION_VALUES,
+    MEASURE_VALUES,
+    BulkResponse,
     InstitutionType,
     JuridicDataResponse,
     MeasureType,
     Ordinance,
     OrdinanceEntry,
+    OrdinancesPage,
     QueryResponse,
 )
 from app.elastic.db import (
     connect_elasticsearch,
-    insert_ordinance,
+    existing_ordinances,
+    get_async_client,
+    insert_ordinance_async,
+    insert_ordinances,
+    ordinance_body,
+    ordinance_exists_async,
     remove_ordinance,
     retrieve_juridic_data,
     retrieve_ordinance,
+    retrieve_ordinances,
 )
 from app.elastic.queries import (
     edit_publication_date,
     extract_keywords,
+    extract_keywords_batch,
     retrieve_ordinances_user,
-    query_ordinances,
+    query_ordinances_async,
     stats_ordinances,
 )
-from app.keywords.model import detect_textrank_keywords, load_spacy_model
+from app.keywords.cache import KeywordsCache
+from app.keywords.model import (
+    detect_textrank_keywords,
+    load_spacy_model,
+    pipeline_signature,
+)
 from app.keywords.dictionary import detect_juridic_keywords, load_juridic_dictionary
 
 # Filename of the juridic keywords file
 JURIDIC_KEYWORDS_FILENAME: Path = Path(os.getenv("SEARCH_JURIDIC_DICTIONARY"))
+# Number of documents parsed together by SpaCy in the bulk insertion
+NLP_BATCH_SIZE: int = 32
+# Number of processes parsing the documents in the bulk insertion
+NLP_PROCESSES: int = int(os.getenv("SEARCH_NLP_PROCESSES", "1"))
+# Directory of the cached TextRank keywords, no cache if not set
+KEYWORDS_CACHE_DIR: Optional[str] = os.getenv("SEARCH_KEYWORDS_CACHE_DIR")
+# Maximum number of contents whose keywords are cached on disk
+KEYWORDS_CACHE_SIZE: int = int(os.getenv("SEARCH_KEYWORDS_CACHE_SIZE", "100000"))
+
+
+@lru_cache(maxsize=1)
+def get_nlp() -> spacy.language.Language:
+    """Gets the custom SpaCy model, loading it only once per process.
+
+    Returns:
+        spacy.language.Language: SpaCy model.
+    """
+    return load_spacy_model()
+
+
+@lru_cache(maxsize=1)
+def get_juridic_dictionary() -> KeywordProcessor:
+    """Gets the juridic keywords detector, loading it only once per process.
+
+    Returns:
+        KeywordProcessor: Keywords detector.
+    """
+    return load_juridic_dictionary(JURIDIC_KEYWORDS_FILENAME)
+
+
+# Loads the read-only models at import, so that a preloading server shares them with its workers
+get_nlp()
+get_juridic_dictionary()
 
+# TextRank keywords of the already parsed contents, shared by the workers on disk
+keywords_cache: Optional[KeywordsCache] = (
+    None
+    if KEYWORDS_CACHE_DIR is None
+    else KeywordsCache(
+        Path(KEYWORDS_CACHE_DIR),
+        pipeline=pipeline_signature(get_nlp()),
+        max_entries=KEYWORDS_CACHE_SIZE,
+    )
+)
 
-app = FastAPI()
 
+def textrank_keywords(contents: List[str], n_process: int = 1) -> List[List[str]]:
+    """Extracts the TextRank keywords of many contents, parsing only the ones not cached.
 
-# Custom SpaCy model
-nlp: spacy.language.Language = load_spacy_model()
+    Args:
+        contents (List[str]): Contents of the ordinances.
+        n_process (int, optional): Number of processes parsing the contents. Defaults to 1.
 
-# Set of juridic keywords
-juridic_dictionary: Set[str] = load_juridic_dictionary(JURIDIC_KEYWORDS_FILENAME)
+    Returns:
+        List[List[str]]: TextRank keywords of each content, in the same order.
+    """
+    # Cached keywords of each content, None if it has to be parsed
+    if keywords_cache is None:
+        cached = [None] * len(contents)
+    else:
+        cached = [keywords_cache.get(content) for content in contents]
+    # Parses the missing contents with SpaCy in batches
+    docs = get_nlp().pipe(
+        (content for content, kws in zip(contents, cached) if kws is None),
+        batch_size=NLP_BATCH_SIZE,
+        n_process=n_process,
+    )
+    results = []
+    for content, kws in zip(contents, cached):
+        if kws is None:
+            kws = detect_textrank_keywords(next(docs))
+            if keywords_cache is not None:
+                keywords_cache.put(content, kws)
+        results.append(kws)
+    return results
 
 
-# Connection to Elasticsearch
-client = connect_elasticsearch()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Connects the worker to Elasticsearch after the fork, so that workers do not share
+    sockets, and closes the connections at shutdown.
+
+    Args:
+        app (FastAPI): Application whose state holds the clients.
+    """
+    # Connection to Elasticsearch
+    app.state.client = connect_elasticsearch()
+    # Asynchronous connection to Elasticsearch, for the searches
+    app.state.async_client = get_async_client()
+    yield
+    await app.state.async_client.close()
+    app.state.client.close()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 
 @app.put("/ordinances/{doc_id}", status_code=status.HTTP_201_CREATED)
-def put_ordinance(doc_id: str, ordinance: Ordinance) -> None:
+async def put_ordinance(doc_id: str, ordinance: Ordinance) -> None:
     """Puts an ordinance in the service.
 
     Args:
@@ -59,39 +162,47 @@ def put_ordinance(doc_id: str, ordinance: Ordinance) -> None:
     Raises:
         HTTPException: If an ordinance with the same content already exists.
     """
+    # An existing ordinance would be rejected, so it is not analyzed at all
+    if await ordinance_exists_async(app.state.async_client, doc_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ordinance with the same content already exists.",
+        )
     # Transforms the list of measure keywords_objects into a list of JSON objects
     measures: List[Mapping] = [
-        {"measure": entry.measure.value, "outcome": entry.outcome}
+        {"measure": entry.measure, "outcome": entry.outcome}
         for entry in ordinance.measures
     ]
-    # Parses the document with SpaCy
-    doc: spacy.language.Doc = nlp(ordinance.content)
-    # Extracts the dictionary keywords
-    dict_keywords: List[str] = detect_juridic_keywords(
-        juridic_dictionary, ordinance.content
+    # Extracts the TextRank keywords while extracting the dictionary keywords
+    # and percolating the juridic ones, each in a thread of the pool
+    (textrank_kws,), dict_keywords, (keywords, entities) = await asyncio.gather(
+        run_in_threadpool(textrank_keywords, [ordinance.content]),
+        run_in_threadpool(
+            detect_juridic_keywords, get_juridic_dictionary(), ordinance.content
+        ),
+        run_in_threadpool(
+            extract_keywords, app.state.client, ordinance.content, measures
+        ),
     )
-    # Extracts the TextRank keywords
-    textrank_keywords: List[str] = detect_textrank_keywords(doc)
-    # Extracts the juridic keywords
-    keywords, entities = extract_keywords(client, ordinance.content, measures)
-
-    # Stores the document
-    stored: bool = insert_ordinance(
-        client=client,
-        doc_id=doc_id,
+
+    # Stores the document, awaiting Elasticsearch without holding a thread
+    body = ordinance_body(
         username=ordinance.username,
         filename=ordinance.filename,
-        institution=ordinance.institution.value,
+        institution=ordinance.institution,
         court=ordinance.court,
         content=ordinance.content,
         measures=measures,
         dictionary_keywords=dict_keywords,
-        textrank_keywords=textrank_keywords,
+        textrank_keywords=textrank_kws,
         juridic_keywords=keywords,
         juridic_entities=entities,
         publication_date=ordinance.publication_date,
         timestamp=ordinance.timestamp,
     )
+    stored: bool = await insert_ordinance_async(
+        app.state.async_client, doc_id, body, refresh="wait_for"
+    )
     if not stored:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -99,14 +210,73 @@ def put_ordinance(doc_id: str, ordinance: Ordinance) -> None:
         )
 
 
+@app.post("/ordinances:bulk", status_code=status.HTTP_201_CREATED)
+def post_ordinances(ordinances: List[OrdinanceEntry]) -> BulkResponse:
+    """Puts many ordinances in the service, parsing and storing them in batches.
+
+    Args:
+        ordinances (List[OrdinanceEntry]): Annotated ordinances with their document ID.
+
+    Returns:
+        BulkResponse: IDs of the inserted ordinances and of the already existing ones.
+    """
+    # Existing ordinances would be rejected, so they are not analyzed at all
+    existing = existing_ordinances(
+        app.state.client, [ordinance.doc_id for ordinance in ordinances]
+    )
+    skipped = [o.doc_id for o in ordinances if o.doc_id in existing]
+    ordinances = [o for o in ordinances if o.doc_id not in existing]
+    # Transforms the lists of measures into lists of JSON objects
+    measures: List[List[Mapping]] = [
+        [
+            {"measure": entry.measure, "outcome": entry.outcome}
+            for entry in ordinance.measures
+        ]
+        for ordinance in ordinances
+    ]
+    contents: List[str] = [ordinance.content for ordinance in ordinances]
+    # Extracts the TextRank keywords, parsing the documents with SpaCy in batches
+    textrank = textrank_keywords(contents, n_process=NLP_PROCESSES)
+    # Extracts the juridic keywords of all the documents with a single request
+    juridic = extract_keywords_batch(app.state.client, list(zip(contents, measures)))
+    # Builds the documents to store
+    bodies = (
+        (
+            ordinance.doc_id,
+            ordinance_body(
+                username=ordinance.username,
+                filename=ordinance.filename,
+                institution=ordinance.institution,
+                court=ordinance.court,
+                content=ordinance.content,
+                measures=ordinance_measures,
+                dictionary_keywords=detect_juridic_keywords(
+                    get_juridic_dictionary(), ordinance.content
+                ),
+                textrank_keywords=textrank_kws,
+                juridic_keywords=keywords,
+                juridic_entities=entities,
+                publication_date=ordinance.publication_date,
+                timestamp=ordinance.timestamp,
+            ),
+        )
+        for ordinance, ordinance_measures, textrank_kws, (keywords, entities) in zip(
+            ordinances, measures, textrank, juridic
+        )
+    )
+    # Stores the documents
+    inserted, conflicts = insert_ordinances(app.state.client, bodies, refresh=True)
+    return {"inserted": inserted, "conflicts": skipped + conflicts}
+
+
 @app.get("/juridic_data")
 def get_juridic_data() -> JuridicDataResponse:
-    keywords, concepts = retrieve_juridic_data(client)
+    keywords, concepts = retrieve_juridic_data(app.state.client)
     return {"keywords": keywords, "concepts": concepts}
 
 
 @app.get("/ordinances")
-def get_ordinances_by_query(
+async def get_ordinances_by_query(
     start_date: date = Query(...),
     end_date: date = Query(...),
     text: str | None = Query(None),
@@ -118,11 +288,11 @@ def get_ordinances_by_query(
     outcome: bool | None = Query(None),
 ) -> QueryResponse:
     # Decodes optional measures and institutions
-    institution = None if institution is None else institution.value
-    measures = None if measures is None else [m.value for m in measures]
+    institution = None if institution is None else INSTITUTION_VALUES[institution]
+    measures = None if measures is None else [MEASURE_VALUES[m] for m in measures]
     # Performs the query
-    response = query_ordinances(
-        client,
+    response = await query_ordinances_async(
+        app.state.async_client,
         text=text,
         keywords=keywords,
         concepts=concepts,
@@ -151,9 +321,28 @@ def get_ordinances_by_query(
 
 @app.get("/ordinances/user")
 def get_ordinances_user(
-    username: str = Query(...), search_from: int = Query(0)
-) -> List[OrdinanceEntry]:
-    return retrieve_ordinances_user(client, username, search_from)
+    username: str = Query(...), cursor: str | None = Query(None)
+) -> OrdinancesPage:
+    try:
+        ordinances, next_cursor = retrieve_ordinances_user(
+            app.state.client, username, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"ordinances": ordinances, "cursor": next_cursor}
+
+
+@app.get("/ordinances/ids")
+def get_ordinances(doc_ids: List[str] = Query(...)) -> List[Optional[Ordinance]]:
+    """Gets many ordinances from the service with a single lookup.
+
+    Args:
+        doc_ids (List[str]): Document IDs.
+
+    Returns:
+        List[Optional[Ordinance]]: Ordinances in the same order of the IDs, null if not found.
+    """
+    return retrieve_ordinances(app.state.client, doc_ids)
 
 
 @app.get("/ordinances/{doc_id}")
@@ -169,7 +358,7 @@ def get_ordinance(doc_id: str) -> Ordinance:
     Returns:
         Ordinance: Ordinance stored in the service, if any.
     """
-    ordinance = retrieve_ordinance(client, doc_id)
+    ordinance = retrieve_ordinance(app.state.client, doc_id)
     if ordinance is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -188,7 +377,7 @@ def delete_ordinance(doc_id: str) -> None:
     Raises:
         HTTPException: If an ordinance with the same content already exists.
     """
-    removed: bool = remove_ordinance(client, doc_id)
+    removed: bool = remove_ordinance(app.state.client, doc_id, refresh="wait_for")
     if not removed:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -203,13 +392,15 @@ def get_count() -> int:
     Returns:
         Statistics: Statistics around the documents.
     """
-    num_docs = stats_ordinances(client)
+    num_docs = stats_ordinances(app.state.client)
     return num_docs
 
 
 @app.put("/dates/{doc_id}", status_code=status.HTTP_202_ACCEPTED)
 def put_publication_date(doc_id: str, publication_date: date = Query(...)) -> None:
-    updated = edit_publication_date(client, doc_id, publication_date)
+    updated = edit_publication_date(
+        app.state.client, doc_id, publication_date, refresh="wait_for"
+    )
     if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,7 +1,7 @@
 from datetime import date
 from enum import Enum
 from typing import List, Mapping, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Extra
 
 
 class InstitutionType(Enum):
@@ -49,14 +49,32 @@ class MeasureType(Enum):
     OTHER = "Altro"
 
 
-class MeasureEntry(BaseModel):
+# Values of the enumerations, precomputed to avoid the enum attribute lookups
+INSTITUTION_VALUES: Mapping[InstitutionType, str] = {
+    institution: institution.value for institution in InstitutionType
+}
+MEASURE_VALUES: Mapping[MeasureType, str] = {
+    measure: measure.value for measure in MeasureType
+}
+
+
+class Schema(BaseModel):
+    """Immutable model that stores the values of its enumerations."""
+
+    class Config:
+        use_enum_values = True
+        allow_mutation = False
+        extra = Extra.ignore
+
+
+class MeasureEntry(Schema):
     """Tuple of a measure and its outcome."""
 
     measure: MeasureType
     outcome: bool
 
 
-class Ordinance(BaseModel):
+class Ordinance(Schema):
     """Anonymized ordinance."""
 
     filename: str
@@ -73,7 +91,21 @@ class OrdinanceEntry(Ordinance):
     doc_id: str
 
 
-class QueryHit(BaseModel):
+class OrdinancesPage(Schema):
+    """Page of ordinances, with the cursor to request the next one."""
+
+    ordinances: List[OrdinanceEntry]
+    cursor: Optional[str]
+
+
+class BulkResponse(Schema):
+    """Response to a bulk insertion of ordinances."""
+
+    inserted: List[str]
+    conflicts: List[str]
+
+
+class QueryHit(Schema):
     """Response entry to a query."""
 
     highlight: str
@@ -88,7 +120,7 @@ class QueryHit(BaseModel):
     juridic_concepts: List[str]
 
 
-class QueryResponse(BaseModel):
+class QueryResponse(Schema):
     """Response to a query, with aggregations and list of hits"""
 
     aggregations: Mapping
@@ -98,7 +130,7 @@ class QueryResponse(BaseModel):
     num_hits: int
 
 
-class JuridicDataResponse(BaseModel):
+class JuridicDataResponse(Schema):
     """Response to a query for the juridic keywords and concepts."""
 
     keywords: List[str]
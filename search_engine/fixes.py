@@ -1,24 +1,47 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Iterator, Mapping
+from typing import Any, Deque, Iterable, Iterator, List, Mapping
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import typer
-import srsly
 from tqdm import tqdm
 
 
+def __read_jsonl(filename: Path) -> Iterator[Mapping]:
+    # Parses one line at a time with orjson, skipping the empty ones
+    with open(filename, "rb") as file:
+        for line in file:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def __format_timestamp(timestamp: Any) -> Any:
+    # Dispatches on the shape of the timestamp, leaving unknown ones untouched
+    try:
+        # Seconds since the epoch, as a number or a numeric string
+        if isinstance(timestamp, (int, float)) or (
+            isinstance(timestamp, str) and timestamp.replace(".", "", 1).isdigit()
+        ):
+            return datetime.fromtimestamp(float(timestamp)).strftime("%Y-%m-%d")
+        # ISO date, only parsed if it looks like one
+        if isinstance(timestamp, str) and len(timestamp) >= 10 and timestamp[4] == "-":
+            return datetime.fromisoformat(timestamp).strftime("%Y-%m-%d")
+    # Out of range or malformed
+    except (ValueError, OverflowError, OSError):
+        pass
+    return timestamp
+
+
 def __get_data(records: Iterable[Mapping]) -> Iterator[Mapping]:
     for record in records:
         data = record["_source"]
-        timestamp = data["timestamp"]
-        try:
-            timestamp = datetime.fromtimestamp(float(timestamp)).strftime("%Y-%m-%d")
-        except:
-            try:
-                timestamp = datetime.fromisoformat(timestamp).strftime("%Y-%m-%d")
-            except:
-                pass
-        yield record["_id"], {
+        timestamp = __format_timestamp(data["timestamp"])
+        yield {
+            "doc_id": record["_id"],
             "timestamp": timestamp,
             "filename": data["filename"],
             "username": data["username"],
@@ -30,18 +53,48 @@ def __get_data(records: Iterable[Mapping]) -> Iterator[Mapping]:
         }
 
 
+def __batches(records: Iterable[Mapping], batch_size: int) -> Iterator[List[Mapping]]:
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
+def __post_batch(session: requests.Session, url: str, batch: List[Mapping]) -> int:
+    # Sends a batch, returning the number of already existing ordinances
+    response = session.post(url, json=batch)
+    response.raise_for_status()
+    return len(response.json()["conflicts"])
+
+
 def main(
     input_filename: Path,
     host: str,
     port: int,
+    batch_size: int = 64,
+    workers: int = 4,
 ) -> None:
-    base_url = f"http://{host}:{port}/ordinances"
-    records = srsly.read_jsonl(input_filename)
+    url = f"http://{host}:{port}/ordinances:bulk"
+    records = __read_jsonl(input_filename)
     records = __get_data(records)
-    for doc_id, data in tqdm(records):
-        url = f"{base_url}/{doc_id}"
-        response = requests.put(url, json=data)
-        response.raise_for_status()
+    # Keep-alive connections, one for each worker
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    # Sends the ordinances in concurrent batches, parsed together by the search engine
+    num_conflicts = 0
+    pending: Deque[Future] = deque()
+    with session, tqdm() as progress:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in __batches(records, batch_size):
+                future = executor.submit(__post_batch, session, url, batch)
+                future.add_done_callback(
+                    lambda _, size=len(batch): progress.update(size)
+                )
+                pending.append(future)
+                # Bounds the batches in memory, waiting for the oldest one
+                if len(pending) >= 2 * workers:
+                    num_conflicts += pending.popleft().result()
+            num_conflicts += sum(future.result() for future in pending)
+    typer.echo(f"{num_conflicts} ordinance(s) already existing")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+from typing import List
+import typer
+from elasticsearch import Elasticsearch
+
+from app.elastic.db import (
+    ES_INDEX_ORDINANCES,
+    ES_MAPPING_ORDINANCES,
+    ES_SETTINGS,
+    MEASURE_PAIR_SEPARATOR,
+    bulk_durability,
+    get_client,
+    mapping_mismatches,
+    versioned_index,
+)
+
+# Fills the flattened measure fields from the stored measures (see `ordinance_body`)
+MEASURES_SCRIPT = """
+List names = new ArrayList();
+List outcomes = new ArrayList();
+List pairs = new ArrayList();
+def measures = ctx._source.measures;
+if (measures != null) {
+    if (!(measures instanceof List)) {
+        measures = [measures];
+    }
+    for (def entry : measures) {
+        String outcome = String.valueOf(entry.outcome).toLowerCase();
+        names.add(entry.measure);
+        outcomes.add(entry.outcome);
+        pairs.add(entry.measure + params.separator + outcome);
+    }
+}
+ctx._source.measures_measure = names;
+ctx._source.measures_outcome = outcomes;
+ctx._source.measures_pair = pairs;
+"""
+
+# Seconds to wait for the reindexing
+REINDEX_TIMEOUT = 3600
+
+
+def __concrete_indices(client: Elasticsearch, index: str) -> List[str]:
+    # Indices behind the alias, or the index itself
+    if client.indices.exists_alias(name=index):
+        return list(client.indices.get_alias(name=index))
+    return [index]
+
+
+def main(index: str = ES_INDEX_ORDINANCES) -> None:
+    # Connects to Elasticsearch, without checking the mapping
+    client = get_client()
+    if not client.indices.exists(index=index):
+        typer.echo("Ordinance index does not exist yet, nothing to migrate.")
+        return
+    mismatches = mapping_mismatches(client, index, ES_MAPPING_ORDINANCES)
+    if len(mismatches) == 0:
+        typer.echo("Ordinance index is up to date.")
+        return
+    typer.echo(f"Outdated ordinance fields: {', '.join(mismatches)}")
+    sources = __concrete_indices(client, index)
+    target = versioned_index(index)
+    if target in sources:
+        typer.echo(f"Index {target} is already in use, bump the mapping version.")
+        raise typer.Exit(code=1)
+    # Creates the new index, replacing the copy left by an interrupted migration
+    if client.indices.exists(index=target):
+        client.indices.delete(index=target)
+    client.indices.create(
+        index=target, body={"settings": ES_SETTINGS, "mappings": ES_MAPPING_ORDINANCES}
+    )
+    # Copies the ordinances, filling the flattened fields of the old ones
+    typer.echo(f"Reindexing {', '.join(sources)} into {target}")
+    with bulk_durability(client, target):
+        client.reindex(
+            body={
+                "source": {"index": sources},
+                "dest": {"index": target, "op_type": "create"},
+                "script": {
+                    "lang": "painless",
+                    "source": MEASURES_SCRIPT,
+                    "params": {"separator": MEASURE_PAIR_SEPARATOR},
+                },
+            },
+            refresh=True,
+            wait_for_completion=True,
+            request_timeout=REINDEX_TIMEOUT,
+        )
+    # Swaps only if every ordinance has been copied
+    expected = client.count(index=sources)["count"]
+    copied = client.count(index=target)["count"]
+    if copied != expected:
+        typer.echo(f"Only {copied} of {expected} ordinances copied, alias not swapped.")
+        raise typer.Exit(code=1)
+    # Points the name to the new index in a single step, dropping the old
+    # index if it had the same name of the alias
+    if sources == [index]:
+        actions = [{"remove_index": {"index": index}}]
+    else:
+        actions = [{"remove": {"index": source, "alias": index}} for source in sources]
+    actions.append({"add": {"index": target, "alias": index}})
+    client.indices.update_aliases(body={"actions": actions})
+    typer.echo(f"Ordinance index migrated to {target}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
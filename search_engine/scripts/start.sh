@@ -26,9 +26,15 @@ function loop_until_connected {
 loop_until_connected "${ELASTIC_ENDPOINT}" "Elasticsearch"
 >&2 echo "All services up and running."
 
+>&2 echo "Migrating the ordinance index, if outdated"
+python /code/migrate_ordinances.py
 >&2 echo "Loading juridic dictionary from ${SEARCH_JURIDIC_KEYWORDS}"
 python /code/load_keywords.py "${SEARCH_JURIDIC_KEYWORDS}"
 >&2 echo "Starting the Search Engine"
 
-# Start the backend app
-uvicorn app.main:app --host "0.0.0.0" --port "8081"
\ No newline at end of file
+# Start the backend app, loading the models once before forking the workers
+gunicorn app.main:app \
+    --worker-class uvicorn.workers.UvicornWorker \
+    --preload \
+    --workers "${SEARCH_WORKERS:-1}" \
+    --bind "0.0.0.0:8081"
\ No newline at end of file
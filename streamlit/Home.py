@@ -8,7 +8,7 @@ from services.search_engine import (
     list_keywords_concepts,
     perform_query,
 )
-from services.visualization import HEIGHT, WIDTH, create_map, create_plot
+from services.visualization import HEIGHT, WIDTH, create_cached_map, create_plot
 from constants import (
     COURT_MEASURE_TYPES,
     COURT_PLACES,
@@ -19,6 +19,27 @@ from constants import (
     OFFICES,
 )
 
+# Style of the hits, monospaced to preserve the layout of the ordinances
+HITS_CSS = (
+    "<style> .stMarkdown>* {white-space: pre-wrap; font-family: monospace;} </style>"
+)
+
+# Label of an outcome, given if the institution is a court and the outcome
+OUTCOME_LABELS: Mapping[Tuple[bool, bool], str] = {
+    (True, True): "Concessa",
+    (True, False): "Rigettata",
+    (False, True): "Accolta",
+    (False, False): "Rigettata",
+}
+
+# Keyword fields of a hit, with their labels
+KEYWORD_FIELDS: List[Tuple[str, str]] = [
+    ("dictionary_keywords", "Parole chiave (dizionario giuridico)"),
+    ("textrank_keywords", "Parole chiave (TextRank)"),
+    ("juridic_keywords", "Parole chiave (diritto penitenziario)"),
+    ("juridic_concepts", "Concetti giuridici (diritto penitenziario)"),
+]
+
 
 def __fetch_keywords_concepts() -> Tuple[List[str], List[str]]:
     # Searches keywords and concepts in session state
@@ -40,7 +61,11 @@ def __set_keywords_concepts(keywords: List[str], concepts: List[str]) -> None:
 
 def __display_aggregations(aggregations: Mapping, is_court: bool):
     # Creates the map
-    data_map = create_map(aggregations)
+    data_map = create_cached_map(
+        tuple(
+            (institution, tuple(places)) for institution, places in aggregations.items()
+        )
+    )
     data = st_folium(data_map, width=WIDTH, height=HEIGHT)
     selected = data["last_object_clicked_tooltip"]
     if selected is None:
@@ -52,43 +77,30 @@ def __display_aggregations(aggregations: Mapping, is_court: bool):
     st.altair_chart(chart)
 
 
-def __display_hits(hits, is_court: bool) -> None:
-    st.markdown(
-        "<style> .stMarkdown>* {white-space: pre-wrap; font-family: monospace;} </style>",
-        unsafe_allow_html=True,
+def __hit_markdown(hit, is_court: bool) -> str:
+    # Title and highlighted fragments
+    lines = [f"### 📃 {hit['institution']} di {hit['court']}", hit["highlight"]]
+    if hit["publication_date"] != "1900-01-01":
+        lines.append(f"🕑 **Data di Pubblicazione**: {hit['publication_date']}")
+    # Measures and outcomes
+    lines.extend(
+        f"🧭 **{measure['measure']}** - *{OUTCOME_LABELS[is_court, measure['outcome']]}*"
+        for measure in hit["measures"]
+    )
+    # Non-empty keywords
+    lines.extend(
+        f"📌 **{label}**: {', '.join(hit[field])}"
+        for field, label in KEYWORD_FIELDS
+        if hit[field]
     )
+    return "\n\n".join(lines)
+
+
+def __display_hits(hits, is_court: bool) -> None:
     for hit in hits:
-        dictionary_keywords = ", ".join(hit["dictionary_keywords"])
-        textrank_keywords = ", ".join(hit["textrank_keywords"])
-        juridic_keywords = ", ".join(hit["juridic_keywords"])
-        juridic_concepts = ", ".join(hit["juridic_concepts"])
         with st.container():
-            st.subheader(f"📃 {hit['institution']} di {hit['court']}")
-            st.write(hit["highlight"], unsafe_allow_html=True)
-            if hit["publication_date"] != "1900-01-01":
-                st.write(f"🕑 **Data di Pubblicazione**: {hit['publication_date']}")
-            # Displays measures and outcomes
-            for measure in hit["measures"]:
-                if is_court:
-                    outcome = "Concessa" if measure["outcome"] else "Rigettata"
-                else:
-                    outcome = "Accolta" if measure["outcome"] else "Rigettata"
-                st.write(f"🧭 **{measure['measure']}** - *{outcome}*")
-            # Displays keywords
-            if len(dictionary_keywords) > 0:
-                st.markdown(
-                    f"📌 **Parole chiave (dizionario giuridico)**: {dictionary_keywords}"
-                )
-            if len(textrank_keywords) > 0:
-                st.markdown(f"📌 **Parole chiave (TextRank)**: {textrank_keywords}")
-            if len(juridic_keywords) > 0:
-                st.markdown(
-                    f"📌 **Parole chiave (diritto penitenziario)**: {juridic_keywords}"
-                )
-            if len(juridic_concepts) > 0:
-                st.markdown(
-                    f"📌 **Concetti giuridici (diritto penitenziario)**: {juridic_concepts}"
-                )
+            # Sends the summary of the hit as a single element
+            st.markdown(__hit_markdown(hit, is_court), unsafe_allow_html=True)
             with st.expander("Leggi tutto"):
                 st.markdown(hit["content"], unsafe_allow_html=True)
         st.divider()
@@ -113,10 +125,11 @@ def main() -> None:
     if keywords is None:
         return
     # Gets selected keywords and concept, if any
+    keywords_set, concepts_set = set(keywords), set(concepts)
     selected_keywords = st.session_state.get("selected_keywords", [])
-    selected_keywords = [kw for kw in selected_keywords if kw in keywords]
+    selected_keywords = [kw for kw in selected_keywords if kw in keywords_set]
     selected_concepts = st.session_state.get("selected_concepts", [])
-    selected_concepts = [cp for cp in selected_concepts if cp in concepts]
+    selected_concepts = [cp for cp in selected_concepts if cp in concepts_set]
     # Displays search controls on the sidebar
     with st.sidebar:
         text = st.text_input(label="Testo Libero")
@@ -177,6 +190,7 @@ def main() -> None:
     with tab_maps:
         __display_aggregations(aggregations, is_court)
     with tab_hits:
+        st.markdown(HITS_CSS, unsafe_allow_html=True)
         __display_hits(hits, is_court)
 
 
@@ -1,12 +1,12 @@
-from typing import Iterable, Set
+from typing import FrozenSet, Iterable, Mapping
 from hashlib import sha256
 
 import streamlit as st
 
-
-@st.cache_data
-def get_hashed_password(password: str) -> str:
-    return sha256(password.encode("utf-8")).hexdigest()
+# Roles of each user, read once from the secrets
+_USER_ROLES: Mapping[str, FrozenSet[str]] = {
+    username: frozenset(roles) for username, roles in st.secrets["roles"].items()
+}
 
 
 def check_authentication():
@@ -19,8 +19,10 @@ def check_authentication():
 
     def password_entered():
         """Checks whether a password entered by the user is correct."""
-        # hash of the password
-        password_hash: str = get_hashed_password(st.session_state["password"])
+        # hash of the password, computed once per login and never cached
+        password_hash: str = sha256(
+            st.session_state["password"].encode("utf-8")
+        ).hexdigest()
         if (
             st.session_state["username"] in st.secrets["credentials"]
             and password_hash == st.secrets["credentials"][st.session_state["username"]]
@@ -55,17 +57,9 @@ def check_authentication():
         return True
 
 
-@st.cache_data
-def to_set(iterable: Iterable[str]) -> Set[str]:
-    """Converts an iterable (a user role list) to set."""
-    return set(iterable)
-
-
 def check_roles(roles: Iterable[str]) -> bool:
     """Returns `True` if the user's roles are between the ones neeeded."""
-    roles: Set[str] = to_set(roles)
-    user_roles: Set[str] = to_set(st.secrets["roles"][st.session_state["username"]])
-    if len(roles & user_roles) == 0:
+    if _USER_ROLES[st.session_state["username"]].isdisjoint(roles):
         st.error("😕 Non hai i permessi necessari per accedere a questa pagina.")
         st.session_state["username"] = st.session_state["username"]
         return False
@@ -1,81 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from queue import Queue
+from threading import Thread
+from time import sleep
 from typing import Any, Iterator, List, Mapping, Optional, Tuple
 from tqdm import tqdm
 import typer
 import srsly
-from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch import Elasticsearch
 from elasticsearch.helpers import scan
+from requests import RequestException
 from services.anonymizer import predict_annotations, correct_annotations
-from services.search_engine import send_ordinance
+from services.search_engine import send_ordinances
 
 
 app = typer.Typer()
 
+# Publication date of the ordinances without one, hidden by the user interface
+UNKNOWN_DATE = "1900-01-01"
+# Attempts to send a batch to the search engine, before sending its ordinances one by one
+SEND_ATTEMPTS = 3
+# Seconds to wait before retrying a batch, doubled at every attempt
+RETRY_DELAY = 1.0
+# Marks the end of the prefetched records
+__END = object()
+
+
+def __prefetch(filepath: Path, maxsize: int = 64) -> Iterator[Mapping[str, Any]]:
+    # Reads the records in a background thread, so that parsing the file
+    # overlaps with the requests to the services
+    records: Queue = Queue(maxsize=maxsize)
+
+    def read() -> None:
+        try:
+            for record in srsly.read_jsonl(filepath):
+                records.put(record)
+        except Exception as e:
+            records.put(e)
+        records.put(__END)
+
+    Thread(target=read, daemon=True).start()
+    for record in iter(records.get, __END):
+        if isinstance(record, Exception):
+            raise record
+        yield record
+
+
+def __anonymize(record: Mapping[str, Any], anonymizer_url: str) -> Mapping[str, Any]:
+    # Creates the record in the Documents (anonymization) Elasticsearch
+    text: str = record["content"]
+    predicted: List[Mapping] = predict_annotations(text, base_url=anonymizer_url)
+    doc_id = correct_annotations(
+        record["username"],
+        record["filename"],
+        text,
+        predicted,
+        record["ground_truth"],
+        timestamp=record["timestamp"],
+        base_url=anonymizer_url,
+    )
+    # Ordinance for the search engine, dated 1900-01-01 when the date is unknown
+    publication_date = record.get("publication_date") or UNKNOWN_DATE
+    return {
+        "doc_id": doc_id,
+        "username": record["username"],
+        "filename": record["filename"],
+        "institution": record["institution"],
+        "court": record["court"],
+        "content": text,
+        "entities": record["ground_truth"],
+        "measures": record["measures"],
+        "publication_date": datetime.strptime(publication_date, "%Y-%m-%d"),
+        "timestamp": record["timestamp"],
+    }
+
+
+def __send_batch(
+    ordinances: List[Mapping[str, Any]], search_url: str
+) -> Tuple[List[str], List[str]]:
+    # Sends the whole batch, retrying it with exponential backoff
+    for attempt in range(SEND_ATTEMPTS):
+        try:
+            _, conflicts = send_ordinances(ordinances, base_url=search_url)
+            return conflicts, []
+        except (ValueError, RequestException) as e:
+            print(f"Batch of {len(ordinances)} ordinance(s) failed: {e}")
+        if attempt < SEND_ATTEMPTS - 1:
+            sleep(RETRY_DELAY * 2**attempt)
+    # Sends the ordinances one at a time, to find the failing ones
+    conflicts, failed = [], []
+    for ordinance in ordinances:
+        try:
+            conflicts.extend(send_ordinances([ordinance], base_url=search_url)[1])
+        except (ValueError, RequestException) as e:
+            print(f"Ordinance {ordinance['doc_id']} failed: {e}")
+            failed.append(ordinance["doc_id"])
+    return conflicts, failed
+
 
 @app.command()
 def upload(
     filepath: Path,
     anonymizer_url: str = "http://localhost:8080",
     search_url: str = "http://localhost:8081",
+    batch_size: int = 64,
+    workers: int = 8,
 ) -> None:
-    for record in tqdm(srsly.read_jsonl(filepath)):
-        # Extracts parameters
-        timestamp: str = record["timestamp"]
-        username: str = record["username"]
-        filename: str = record["filename"]
-        text: str = record["content"]
-        ground_truth: List[Mapping] = record["ground_truth"]
-        institution = record["institution"]
-        court: str = record["court"]
-        measures: List[Mapping] = record["measures"]
-        # Creates the record in the Documents (anonymization) Elasticsearch
-        try:
-            predicted: List[Mapping] = predict_annotations(
-                text, base_url=anonymizer_url
-            )
-            doc_id = correct_annotations(
-                username,
-                filename,
-                text,
-                predicted,
-                ground_truth,
-                timestamp=timestamp,
-                base_url=anonymizer_url,
-            )
-            # Creates the record in the Ordinances (search engine) Elasticsearch
-            send_ordinance(
-                doc_id,
-                username,
-                filename,
-                institution,
-                court,
-                text,
-                ground_truth,
-                measures,
-                timestamp=timestamp,
-                base_url=search_url,
-            )
-        except ValueError as e:
-            print(e)
-            continue
+    records = __prefetch(filepath)
+    not_sent: List[str] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm() as progress:
+        while batch := list(islice(records, batch_size)):
+            # Anonymizes the records of the batch concurrently
+            futures = [
+                executor.submit(__anonymize, record, anonymizer_url) for record in batch
+            ]
+            ordinances = []
+            for future in as_completed(futures):
+                try:
+                    ordinances.append(future.result())
+                except ValueError as e:
+                    print(e)
+                progress.update()
+            if len(ordinances) == 0:
+                continue
+            # Creates the records in the Ordinances (search engine) Elasticsearch
+            conflicts, failed = __send_batch(ordinances, search_url)
+            for doc_id in conflicts:
+                print(f"Ordinance {doc_id} already exists in the search engine.")
+            not_sent.extend(failed)
+    # Reports the documents stored by the anonymizer but missing from the search engine
+    if len(not_sent) > 0:
+        print(f"{len(not_sent)} ordinance(s) not stored in the search engine:")
+        for doc_id in not_sent:
+            print(doc_id)
 
 
 def __scan_index(
-    client: Elasticsearch, index: str
-) -> Iterator[Tuple[str, Mapping[str, Any]]]:
-    query = {"sort": {"timestamp": "asc"}}
-    for hit in scan(client, index=index, query=query):
-        yield hit["_id"], hit["_source"]
+    client: Elasticsearch, index: str, batch_size: int = 2000
+) -> Iterator[List[Tuple[str, Mapping[str, Any]]]]:
+    # Yields the documents in batches, each one fetched with a single scroll page
+    # in index order, the cheapest one
+    hits = scan(client, index=index, size=batch_size, request_timeout=120)
+    while batch := [(hit["_id"], hit["_source"]) for hit in islice(hits, batch_size)]:
+        yield batch
 
 
-def __get_item(
-    client: Elasticsearch, index: str, doc_id: str, fields: List[str]
-) -> Optional[Mapping[str, Any]]:
-    try:
-        result = client.get(index=index, id=doc_id, _source=fields)
-        return result["_source"]
-    except NotFoundError:
-        return None
+def __get_items(
+    client: Elasticsearch, index: str, doc_ids: List[str], fields: List[str]
+) -> List[Optional[Mapping[str, Any]]]:
+    # Looks up all the documents with a single request, None for the missing ones
+    result = client.mget(index=index, body={"ids": doc_ids}, _source=fields)
+    return [doc["_source"] if doc["found"] else None for doc in result["docs"]]
 
 
 def __merge_indices(
@@ -84,11 +161,11 @@ def __merge_indices(
     anon_index: str = "documents",
     search_index: str = "ordinances",
 ) -> Iterator[Mapping[str, Any]]:
-    for doc_id, anon_hit in __scan_index(anon_es, index=anon_index):
-        search_hit = __get_item(
+    for batch in __scan_index(anon_es, index=anon_index):
+        search_hits = __get_items(
             search_es,
             index=search_index,
-            doc_id=doc_id,
+            doc_ids=[doc_id for doc_id, _ in batch],
             fields=[
                 "institution",
                 "court",
@@ -97,13 +174,14 @@ def __merge_indices(
                 "pos_keywords",
             ],
         )
-        if search_hit is None:
-            typer.echo(
-                f"Document {anon_hit['filename']} not found in the search engine.",
-                err=True,
-            )
-        else:
-            yield {"doc_id": doc_id, **anon_hit, **search_hit}
+        for (doc_id, anon_hit), search_hit in zip(batch, search_hits):
+            if search_hit is None:
+                typer.echo(
+                    f"Document {anon_hit['filename']} not found in the search engine.",
+                    err=True,
+                )
+            else:
+                yield {"doc_id": doc_id, **anon_hit, **search_hit}
 
 
 @app.command()
@@ -1,11 +1,11 @@
-from typing import List, Mapping, Tuple
+from typing import Mapping, Tuple
 
 # Possible institutions
-INSTITUTIONS: List[str] = ["Tribunale di Sorveglianza", "Ufficio di Sorveglianza"]
+INSTITUTIONS: Tuple[str, ...] = ("Tribunale di Sorveglianza", "Ufficio di Sorveglianza")
 
 
 # Possible measure types
-COURT_MEASURE_TYPES: List[str] = [
+COURT_MEASURE_TYPES: Tuple[str, ...] = (
     "Affidamento in prova al servizio sociale (art. 47 l. Ord. Pen.)",
     "Affidamento terapeutico (art. 94 D.P.R. 309/1990)",
     "Detenzione domiciliare (art. 47 ter e 47 quater l. Ord. Pen.)",
@@ -18,15 +18,15 @@ COURT_MEASURE_TYPES: List[str] = [
     "Opposizione all'Espulsione (art. 16 D. Lgs. 286/1998)",
     "Revoca di un Provvedimento",
     "Altro",
-]
-OFFICE_MEASURE_TYPES: List[str] = [
+)
+OFFICE_MEASURE_TYPES: Tuple[str, ...] = (
     "Reclamo giurisdizionale (artt. 69 co. 6° lett. b) e 35-bis o.p.)",
     "Rimedio compensativo/risarcitorio per trattamento inumano e degradante (art. 35-ter o.p.)",
     "Misure di sicurezza - Applicazione (artt. 69 co. 4° o.p. e 679 c.p.p.)",
     "Misure di sicurezza - Esecuzione (artt. 69 co. 4° o.p. e 679 c.p.p.)",
     "Misure di sicurezza - Trasformazione (artt. 69 co. 4° o.p. e 679 c.p.p.)",
     "Misure di sicurezza - Revoca (artt. 69 co. 4° o.p. e 679 c.p.p.)",
-]
+)
 
 
 # Names and coordinates of the courts and offices
@@ -54,9 +54,9 @@ OFFICE_PLACES: Mapping[str, Tuple[float, float]] = {
 
 
 # All the "Tribunale di Sorveglianza" and "Ufficio di Sorveglianza" in Italy
-COURTS: List[str] = COURT_PLACES.keys()
-OFFICES: List[str] = OFFICE_PLACES.keys()
+COURTS: Tuple[str, ...] = tuple(COURT_PLACES)
+OFFICES: Tuple[str, ...] = tuple(OFFICE_PLACES)
 
 
 # Possible outcomes
-OUTCOME_TYPES: List[str] = ["Concessa", "Rigettata"]
+OUTCOME_TYPES: Tuple[str, ...] = ("Concessa", "Rigettata")
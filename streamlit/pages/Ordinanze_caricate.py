@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Dict, List
+from typing import List, Optional
 
 import streamlit as st
 from auth import check_authentication, check_roles
@@ -56,11 +56,12 @@ def list_data_user() -> None:
         return
     # Gets the username to fetch
     username: str = st.session_state["username"]
-    # If available, gets the starting index
-    search_from: int = st.session_state.get("search_from", 0)
+    # Cursors of the visited pages, the last one is the current page
+    cursors: List[Optional[str]] = st.session_state.setdefault("cursors", [None])
+    search_from: int = (len(cursors) - 1) * 10
     # Ordinances of the user
     try:
-        ordinances: List[Dict] = list_ordinances_user(username, search_from)
+        ordinances, next_cursor = list_ordinances_user(username, cursors[-1])
     except ValueError as e:
         st.error("Impossibile scaricare la lista delle ordinanze.")
         st.error(str(e))
@@ -103,13 +104,13 @@ def list_data_user() -> None:
     col_prev, _, col_next = st.columns(3)
     with col_prev:
         if st.button("⬅️ Precedente"):
-            search_from = st.session_state.get("search_from", 0)
-            st.session_state["search_from"] = max(0, search_from - 10)
+            if len(cursors) > 1:
+                cursors.pop()
             st.experimental_rerun()
     with col_next:
         if st.button("Successivo ➡️"):
-            search_from = st.session_state.get("search_from", 0)
-            st.session_state["search_from"] = search_from + 10
+            if next_cursor is not None:
+                cursors.append(next_cursor)
             st.experimental_rerun()
 
 
@@ -23,6 +23,32 @@ def __redact_content(text: str, entities: List[Dict]) -> str:
     return text
 
 
+def __ordinance_body(
+    username: str,
+    filename: str,
+    institution: str,
+    court: str,
+    content: str,
+    entities: List[Dict],
+    measures: List[Dict],
+    publication_date: datetime,
+    timestamp: int | str = None,
+) -> Dict[str, Any]:
+    # Body of an ordinance for the search engine, with the redacted content
+    body = {
+        "filename": filename,
+        "username": username,
+        "institution": institution,
+        "court": court,
+        "content": __redact_content(content, entities),
+        "measures": measures,
+        "publication_date": publication_date.strftime("%Y-%m-%d"),
+    }
+    if timestamp is not None:
+        body["timestamp"] = timestamp
+    return body
+
+
 def get_count(base_url: str = None) -> int:
     """Downloads the number of documents in the service.
 
@@ -74,22 +100,20 @@ def send_ordinance(
     """
     if base_url is None:
         base_url = _get_search_engine_url()
-    # Redacts the content
-    content: str = __redact_content(content, entities)
     # Gets the service URL
     url: str = base_url + "/ordinances/" + doc_id
     # Performs the API call
-    body = {
-        "filename": filename,
-        "username": username,
-        "institution": institution,
-        "court": court,
-        "content": content,
-        "measures": measures,
-        "publication_date": publication_date.strftime("%Y-%m-%d"),
-    }
-    if timestamp is not None:
-        body["timestamp"] = timestamp
+    body = __ordinance_body(
+        username,
+        filename,
+        institution,
+        court,
+        content,
+        entities,
+        measures,
+        publication_date,
+        timestamp,
+    )
     response: Response = requests.put(
         url,
         json=body,
@@ -97,6 +121,48 @@ def send_ordinance(
     get_json_response(response)
 
 
+def send_ordinances(
+    ordinances: List[Mapping[str, Any]], base_url: str = None
+) -> Tuple[List[str], List[str]]:
+    """Sends many new ordinances to the search engine with a single request.
+
+    Args:
+        ordinances (List[Mapping[str, Any]]): Ordinances, each one with the arguments of `send_ordinance`.
+        base_url (str, optional): Base URL of the service. Defaults to None.
+
+    Raises:
+        ValueError: If there is an error in the HTTP response.
+
+    Returns:
+        Tuple[List[str], List[str]]: IDs of the inserted ordinances and of the already existing ones.
+    """
+    if base_url is None:
+        base_url = _get_search_engine_url()
+    # Gets the service URL
+    url: str = base_url + "/ordinances:bulk"
+    # Performs the API call
+    body = [
+        {
+            "doc_id": ordinance["doc_id"],
+            **__ordinance_body(
+                ordinance["username"],
+                ordinance["filename"],
+                ordinance["institution"],
+                ordinance["court"],
+                ordinance["content"],
+                ordinance["entities"],
+                ordinance["measures"],
+                ordinance["publication_date"],
+                ordinance.get("timestamp"),
+            ),
+        }
+        for ordinance in ordinances
+    ]
+    response: Response = requests.post(url, json=body)
+    result = get_json_response(response)
+    return result["inserted"], result["conflicts"]
+
+
 def get_ordinance(doc_id: str, base_url: str = None) -> Mapping[str, Mapping]:
     """Gets an ordinance from the server.
 
@@ -136,36 +202,42 @@ def delete_ordinance(doc_id: str, base_url: str = None) -> None:
 
 
 def list_ordinances_user(
-    username: str, search_from: int = 0, base_url: str = None
-) -> List[Mapping]:
-    """Lists all the documents posted by the user.
+    username: str, cursor: Optional[str] = None, base_url: str = None
+) -> Tuple[List[Mapping], Optional[str]]:
+    """Lists a page of the documents posted by the user.
 
     Args:
         username (str): User to list.
-        search_from (int, optional): Search index to use as a starting point. Defaults to 0.
+        cursor (Optional[str], optional): Cursor of the page, None for the first one. Defaults to None.
         base_url (str, optional): Base URL of the service. Defaults to None.
 
     Raises:
         ValueError: If there is an error in the HTTP API.
 
     Returns:
-        List[Mapping]: List of entries in the form `{"doc_id": ..., "filename": ...}`
+        Tuple[List[Mapping], Optional[str]]: List of entries in the form `{"doc_id": ..., "filename": ...}`
+        and cursor of the next page, if any.
     """
     if base_url is None:
         base_url = _get_search_engine_url()
     url: str = base_url + "/ordinances/user"
-    params = {"username": username, "search_from": search_from}
+    params = {"username": username}
+    if cursor is not None:
+        params["cursor"] = cursor
     response: Response = requests.get(url, params=params)
-    entries: List[Dict] = get_json_response(response)
+    page: Dict = get_json_response(response)
+    entries: List[Dict] = page["ordinances"]
     for entry in entries:
         entry["content"] = entry["content"].replace("\n", "<br/>")
         if "publication_date" in entry and entry["publication_date"] is not None:
             entry["publication_date"] = datetime.strptime(
                 entry["publication_date"], "%Y-%m-%d"
             ).date()
-    return entries
+    return entries, page["cursor"]
 
 
+# Repeated reruns with the same filters reuse the results for a minute
+@st.cache_data(ttl=60, show_spinner=False)
 def perform_query(
     text: Optional[str],
     keywords: List[str],
@@ -4,6 +4,7 @@ from matplotlib.figure import Figure
 import folium
 import altair as alt
 import pandas as pd
+import streamlit as st
 
 from constants import COURT_PLACES, OFFICE_PLACES
 
@@ -17,6 +18,9 @@ HEIGHT = 500
 ZOOM = 8
 # Graph font size
 FONT_SIZE = 12
+# Maximum number of cached maps and seconds each one is kept
+MAP_CACHE_ENTRIES = 64
+MAP_CACHE_TTL = 3600
 
 
 def __create_points(
@@ -66,6 +70,15 @@ def create_map(
     return data_map
 
 
+@st.cache_resource(max_entries=MAP_CACHE_ENTRIES, ttl=MAP_CACHE_TTL, show_spinner=False)
+def create_cached_map(places: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> folium.Map:
+    # The markers only depend on the places of each institution, so the map is
+    # built once for every distinct set of places and shared between reruns
+    return create_map(
+        {institution: dict.fromkeys(names) for institution, names in places}
+    )
+
+
 def __to_records(
     dictionary: Mapping[str, Mapping[str, Mapping]], true_label: str
 ) -> Iterable[Mapping]: